@@ -0,0 +1,193 @@
+import typing
+import array
+import mmap
+import struct
+import sys
+
+from problem import Problem
+from core import Core, triangle_index
+
+# Binary file format for a problem and its solution, which can be read
+# through mmap without parsing the whole file. All numbers are little-endian.
+#
+#   header      magic "PAIRS\0", version (u16), N (u32), R (u32), padding
+#   presence    N bytes, 1 if present
+#   name index  N + 1 offsets (u32) into the name data
+#   name data   UTF-8 names, one after the other
+#   met         the triangular bit array from core.py: the bit for i > j is
+#               at (i * (i - 1)) // 2 + j
+#   schedule    R x N (i16): the person met in round r by person i, or -1
+#
+# Each section starts at a multiple of 8 bytes.
+
+MAGIC = b"PAIRS\0"
+VERSION = 1
+HEADER = struct.Struct("<6sHII")
+ALIGN = 8
+MAX_PEOPLE = 1 << 15
+
+# Typecodes of the arrays in the file
+Typecode = typing.Literal["I", "h"]
+
+class FormatError(Exception):
+    pass
+
+def align(offset: int) -> int:
+    return (offset + ALIGN - 1) & ~(ALIGN - 1)
+
+def little_endian(values: "array.array[int]") -> bytes:
+    if sys.byteorder != "little":
+        values = array.array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+def to_bytes(problem: Problem) -> bytes:
+    core = Core.from_problem(problem)
+    if core.num_people >= MAX_PEOPLE:
+        raise FormatError("Too many people for the binary format")
+
+    names = [name.encode("utf-8") for name in core.names]
+    name_index = array.array("I", [0])
+    for name in names:
+        name_index.append(name_index[-1] + len(name))
+
+    sections = [bytes(core.present), little_endian(name_index), b"".join(names),
+                bytes(core.met), little_endian(array.array("h", core.schedule))]
+    out = [HEADER.pack(MAGIC, VERSION, core.num_people, core.num_rounds)]
+    size = HEADER.size
+    for section in sections:
+        out.append(b"\0" * (align(size) - size))
+        out.append(section)
+        size = align(size) + len(section)
+    return b"".join(out)
+
+def write(problem: Problem, filename: str) -> None:
+    with open(filename, "wb") as fd:
+        fd.write(to_bytes(problem))
+
+class BinaryProblem:
+    # Lazy reader: the file is mapped into memory and each query only
+    # reads the bytes it needs
+    def __init__(self, filename: str) -> None:
+        self.fd = open(filename, "rb")
+        try:
+            self.data = mmap.mmap(self.fd.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self.fd.close()
+            raise FormatError("Empty file") from None
+        try:
+            self.parse()
+        except Exception:
+            self.close()
+            raise
+
+    def parse(self) -> None:
+        if len(self.data) < HEADER.size:
+            raise FormatError("File is too short")
+        (magic, version, num_people, num_rounds) = HEADER.unpack_from(self.data, 0)
+        self.num_people: int = num_people
+        self.num_rounds: int = num_rounds
+        if magic != MAGIC:
+            raise FormatError("Not a pairs file")
+        if version != VERSION:
+            raise FormatError("Unsupported version {}".format(version))
+
+        # Every section is checked against the size of the file before it
+        # is used, so a damaged header can't lead to reads past the end
+        n = self.num_people
+        view = memoryview(self.data)
+        self.views: typing.List[memoryview] = [view]
+        offset = align(HEADER.size)
+        self.presence = self.section(view, offset, n)
+        offset = align(offset + n)
+        self.name_index = self.cast(self.section(view, offset, 4 * (n + 1)), "I")
+        offset = align(offset + (4 * (n + 1)))
+
+        # Names are found from the offsets, which must start at 0 and not
+        # go backwards or past the end of the file
+        self.name_data = offset
+        if self.name_index[0] != 0:
+            raise FormatError("Bad name index")
+        for i in range(n):
+            if self.name_index[i] > self.name_index[i + 1]:
+                raise FormatError("Bad name index")
+        if len(self.data) < (offset + self.name_index[n]):
+            raise FormatError("File is too short")
+        offset = align(offset + self.name_index[n])
+
+        self.met = self.section(view, offset, (((n * (n - 1)) // 2) + 7) // 8)
+        offset = align(offset + len(self.met))
+        self.schedule = self.cast(self.section(view, offset, 2 * n * self.num_rounds), "h")
+        self.lookup: typing.Optional[typing.Dict[str, int]] = None
+
+    def section(self, view: memoryview, offset: int, size: int) -> memoryview:
+        if len(self.data) < (offset + size):
+            raise FormatError("File is too short")
+        result = view[offset:offset + size]
+        self.views.append(result)
+        return result
+
+    def cast(self, view: memoryview, typecode: Typecode) -> typing.Sequence[int]:
+        if (sys.byteorder != "little") or (len(view) % struct.calcsize(typecode)):
+            values: "array.array[int]" = array.array(typecode)
+            values.frombytes(view[:len(view) - (len(view) % struct.calcsize(typecode))])
+            if sys.byteorder != "little":
+                values.byteswap()
+            return values
+        cast = view.cast(typecode)
+        self.views.append(cast)
+        return cast
+
+    def close(self) -> None:
+        for view in reversed(getattr(self, "views", [])):
+            view.release()
+        self.views = []
+        self.data.close()
+        self.fd.close()
+
+    def __enter__(self) -> "BinaryProblem":
+        return self
+
+    def __exit__(self, *args: typing.Any) -> None:
+        self.close()
+
+    def name(self, i: int) -> str:
+        start = self.name_data + self.name_index[i]
+        end = self.name_data + self.name_index[i + 1]
+        return bytes(self.data[start:end]).decode("utf-8")
+
+    def find(self, name: str) -> int:
+        # Person number for a name, or -1. The first call reads every name.
+        if self.lookup is None:
+            self.lookup = dict()
+            for i in range(self.num_people):
+                self.lookup[self.name(i)] = i
+        return self.lookup.get(name, -1)
+
+    def is_present(self, i: int) -> bool:
+        return bool(self.presence[i])
+
+    def is_met(self, i: int, j: int) -> bool:
+        k = triangle_index(i, j)
+        return bool(self.met[k >> 3] & (1 << (k & 7)))
+
+    def partner(self, r: int, i: int) -> int:
+        return self.schedule[(r * self.num_people) + i]
+
+    def schedule_of(self, i: int) -> typing.List[int]:
+        return [self.partner(r, i) for r in range(self.num_rounds)]
+
+    def to_core(self) -> Core:
+        core = Core(self.num_people, self.num_rounds)
+        core.names = [self.name(i) for i in range(self.num_people)]
+        core.present[:] = self.presence
+        core.met[:] = self.met
+        core.schedule = array.array("i", self.schedule)
+        return core
+
+    def to_problem(self) -> Problem:
+        return self.to_core().to_problem()
+
+def read(filename: str) -> Problem:
+    with BinaryProblem(filename) as reader:
+        return reader.to_problem()
@@ -0,0 +1,110 @@
+import typing
+
+from problem import Problem, Person, Bound
+
+# Lower bounds on the number of rounds needed to complete a Problem.
+# The people who are present are the vertices of a graph, and each meeting
+# which still has to happen is an edge. Each round is a matching, so:
+#
+# * Nobody can have fewer rounds than meetings (the maximum degree).
+# * A group of k people can hold at most floor(k / 2) meetings in each
+#   round, so a group which must still hold m meetings among themselves
+#   needs at least m / floor(k / 2) rounds. This is strongest when k is
+#   odd ("overfull" subgraphs): someone in the group sits out every round.
+#   The groups tried are everyone, each connected component, and each of
+#   these with the person who has fewest meetings left taken out.
+# * The odd chains described in algorithms.md are the special case of a
+#   connected component where everyone must meet two others and the number
+#   of people is odd: two rounds are not enough, three are needed.
+#
+# If a schedule has as many rounds as the bound, it is optimal.
+
+Graph = typing.Dict[Person, typing.Set[Person]]
+
+def meetings_graph(problem: Problem) -> Graph:
+    present = [p1 for p1 in problem.people if p1.is_present]
+    graph: Graph = dict()
+    for p1 in present:
+        graph[p1] = set(present)
+        graph[p1].difference_update(p1.already_met)
+        graph[p1].discard(p1)
+    for p1 in present:
+        for p2 in p1.already_met:
+            graph.get(p2, set()).discard(p1)
+    return graph
+
+def components(graph: Graph) -> typing.List[typing.List[Person]]:
+    # Connected components with at least one meeting, in problem order
+    order: typing.Dict[Person, int] = dict()
+    for p1 in graph:
+        order[p1] = len(order)
+
+    seen: typing.Set[Person] = set()
+    result: typing.List[typing.List[Person]] = []
+    for p1 in graph:
+        if (p1 in seen) or (len(graph[p1]) == 0):
+            continue
+        component = [p1]
+        seen.add(p1)
+        i = 0
+        while i < len(component):
+            for p2 in graph[component[i]]:
+                if p2 not in seen:
+                    seen.add(p2)
+                    component.append(p2)
+            i += 1
+        component.sort(key=lambda p2: order[p2])
+        result.append(component)
+    return result
+
+def names(people: typing.List[Person]) -> str:
+    return ", ".join([p1.name for p1 in people])
+
+def group_bound(graph: Graph, group: typing.List[Person], what: str,
+                connected: bool = False) -> Bound:
+    # group must be a union of components, or one with a person taken out.
+    # If it is one component, it may be an odd chain.
+    members = set(group)
+    meetings = sum([len(graph[p1] & members) for p1 in group]) // 2
+    per_round = len(group) // 2
+    if per_round == 0:
+        return Bound(0, "", group)
+
+    rounds = (meetings + per_round - 1) // per_round
+    if (connected and ((len(group) % 2) == 1)
+    and all([len(graph[p1] & members) == 2 for p1 in group])):
+        reason = "{} form an odd chain of {} people".format(names(group), len(group))
+    else:
+        reason = "{} {} must still hold {} meetings, at most {} in each round".format(
+                    what, names(group), meetings, per_round)
+    return Bound(rounds, reason, group)
+
+def lower_bound(problem: Problem) -> Bound:
+    graph = meetings_graph(problem)
+    best = Bound(0, "nobody needs to meet", [])
+
+    for p1 in graph:
+        if len(graph[p1]) > best.rounds:
+            best = Bound(len(graph[p1]), "{} must still meet {} people".format(
+                            p1.name, len(graph[p1])), [p1])
+
+    parts = components(graph)
+    groups: typing.List[typing.Tuple[typing.List[Person], str, bool]] = []
+    everyone = [p1 for p1 in graph if len(graph[p1]) != 0]
+    if len(parts) > 1:
+        groups.append((everyone, "the people", False))
+    for part in parts:
+        groups.append((part, "the people", True))
+
+    for (group, what, connected) in groups[:]:
+        if len(group) > 2:
+            fewest = min(group, key=lambda p1: len(graph[p1]))
+            groups.append(([p1 for p1 in group if p1 is not fewest],
+                            "apart from {}, the people".format(fewest.name), False))
+
+    for (group, what, connected) in groups:
+        bound = group_bound(graph, group, what, connected)
+        if bound.rounds > best.rounds:
+            best = bound
+
+    return best
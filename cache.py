@@ -0,0 +1,218 @@
+import typing
+import hashlib
+import json
+import os
+
+from problem import Problem, Person, NOBODY
+from symmetry import refine, twin_classes, neighbour_list
+import solve
+
+# On-disk cache of solved problems. The key doesn't depend on names or on
+# the order of people: it is a canonical form of the graph of who has
+# already met whom, among the people who are present.
+#
+# The canonical form comes from individualisation and refinement. Colour
+# refinement splits the people into classes; while some class has more than
+# one member, each member is given its own colour in turn and the colours
+# are refined again. Every branch ends with a distinct colour for each
+# person, which orders them, and the ordering whose relabelled graph is
+# smallest is the canonical one. Twins give identical branches, so only one
+# twin is tried from each class.
+#
+# Each branch ends with a refinement, which can take up to N rounds of
+# O(N^2) work, so the number of branches is limited. Graphs with a lot of
+# symmetry that twins don't explain need many branches: a cycle of N people
+# needs 2N, and at N = 100 each branch takes about 50ms. The number of
+# branches is estimated from the first one (the product of the number of
+# choices at each level), and the problem isn't cached if the estimate or
+# the actual number is over the limit.
+#
+# Each cache entry is a JSON file holding the relabelled graph and the
+# schedule, as pairs of canonical positions in each round. The least
+# recently used entries are removed when there are too many. Schedules
+# found after the solver ran out of time are not cached, so that they are
+# solved again next time.
+
+CACHE_VERSION = 2
+DEFAULT_MAX_ENTRIES = 1000
+DEFAULT_MAX_LEAVES = 64
+
+Certificate = typing.Tuple[int, ...]
+
+def relabel(neighbours: typing.List[int], order: typing.List[int]) -> Certificate:
+    position = [0 for i in order]
+    for (k, i) in enumerate(order):
+        position[i] = k
+    result: typing.List[int] = []
+    for i in order:
+        mask = 0
+        for j in neighbour_list(neighbours[i]):
+            mask |= 1 << position[j]
+        result.append(mask)
+    return tuple(result)
+
+class TooSymmetric(Exception):
+    pass
+
+def canonical_labelling(neighbours: typing.List[int], max_leaves: int = DEFAULT_MAX_LEAVES
+            ) -> typing.Optional[typing.Tuple[typing.List[int], Certificate]]:
+    # Returns the canonical order of the people, and the graph relabelled in
+    # that order, or None if finding them would take more than max_leaves
+    # branches
+    num_people = len(neighbours)
+    twin_of = twin_classes(neighbours)
+    best: typing.List[typing.Tuple[Certificate, typing.List[int]]] = []
+    leaves = [0]
+    estimate = [1]
+
+    def search(colours: typing.List[int]) -> None:
+        colours = refine(neighbours, colours)
+        sizes: typing.Dict[int, int] = dict()
+        for c in colours:
+            sizes[c] = sizes.get(c, 0) + 1
+
+        target = [c for c in sorted(sizes) if sizes[c] > 1]
+        if len(target) == 0:
+            order = sorted(range(num_people), key=lambda i: colours[i])
+            certificate = relabel(neighbours, order)
+            if (len(best) == 0) or (certificate < best[0][0]):
+                best[:] = [(certificate, order)]
+            leaves[0] += 1
+            if (estimate[0] > max_leaves) or (leaves[0] > max_leaves):
+                raise TooSymmetric()
+            return
+
+        # Individualise one member of each twin class in the first
+        # non-trivial class: it gets a colour just before the rest of its class
+        choices: typing.List[int] = []
+        tried: typing.Set[int] = set()
+        for i in range(num_people):
+            if (colours[i] == target[0]) and (twin_of[i] not in tried):
+                tried.add(twin_of[i])
+                choices.append(i)
+        if leaves[0] == 0:
+            # Still on the first branch
+            estimate[0] *= len(choices)
+
+        for i in choices:
+            search([(2 * c) if j == i else ((2 * c) + 1)
+                        for (j, c) in enumerate(colours)])
+
+    try:
+        search([0 for i in range(num_people)])
+    except TooSymmetric:
+        return None
+    (certificate, order) = best[0]
+    return (order, certificate)
+
+def met_graph(people: typing.List[Person]) -> typing.List[int]:
+    index: typing.Dict[Person, int] = dict()
+    for (i, p1) in enumerate(people):
+        index[p1] = i
+    neighbours = [0 for p1 in people]
+    for (i, p1) in enumerate(people):
+        for p2 in p1.already_met:
+            j = index.get(p2, -1)
+            if j >= 0:
+                neighbours[i] |= 1 << j
+                neighbours[j] |= 1 << i
+    return neighbours
+
+class SolutionCache:
+    def __init__(self, directory: str, max_entries: int = DEFAULT_MAX_ENTRIES) -> None:
+        self.directory = directory
+        self.max_entries = max_entries
+
+    def lookup(self, problem: Problem) -> typing.Optional[
+                    typing.Tuple[str, typing.List[Person], Certificate]]:
+        # Returns the cache file name, the people present in canonical order,
+        # and the relabelled graph, or None if the problem can't be cached
+        people = [p1 for p1 in problem.people if p1.is_present]
+        labelling = canonical_labelling(met_graph(people))
+        if labelling is None:
+            return None
+        (order, certificate) = labelling
+        digest = hashlib.sha256("{}:{}".format(len(people),
+                    ",".join(["{:x}".format(mask) for mask in certificate])).encode("ascii"))
+        path = os.path.join(self.directory, digest.hexdigest()[:32] + ".json")
+        return (path, [people[i] for i in order], certificate)
+
+    def get(self, problem: Problem) -> typing.Optional[bool]:
+        # On a hit, fills in the schedule and returns True if it is optimal.
+        # On a miss, returns None.
+        key = self.lookup(problem)
+        if key is None:
+            return None
+        (path, people, certificate) = key
+        try:
+            with open(path, "rt") as fd:
+                entry = json.load(fd)
+        except (OSError, ValueError):
+            return None
+
+        if ((entry.get("version") != CACHE_VERSION)
+        or (tuple(int(mask, 16) for mask in entry["met"]) != certificate)):
+            return None
+
+        problem.reset()
+        for (r, pairs) in enumerate(entry["rounds"]):
+            for (i, j) in pairs:
+                people[i].schedule.append(people[j])
+                people[j].schedule.append(people[i])
+            for p1 in people:
+                if len(p1.schedule) == r:
+                    p1.schedule.append(NOBODY)
+
+        os.utime(path)
+        return bool(entry["optimal"])
+
+    def put(self, problem: Problem, optimal: bool) -> None:
+        key = self.lookup(problem)
+        if key is None:
+            return
+        (path, people, certificate) = key
+        index: typing.Dict[Person, int] = dict()
+        for (i, p1) in enumerate(people):
+            index[p1] = i
+
+        num_rounds = max([len(p1.schedule) for p1 in people], default=0)
+        rounds: typing.List[typing.List[typing.Tuple[int, int]]] = []
+        for r in range(num_rounds):
+            pairs: typing.List[typing.Tuple[int, int]] = []
+            for (i, p1) in enumerate(people):
+                p2 = p1.schedule[r] if r < len(p1.schedule) else NOBODY
+                if (p2 is not NOBODY) and (i < index[p2]):
+                    pairs.append((i, index[p2]))
+            rounds.append(pairs)
+
+        entry = {
+            "version": CACHE_VERSION,
+            "met": ["{:x}".format(mask) for mask in certificate],
+            "optimal": optimal,
+            "rounds": rounds,
+        }
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wt") as fd:
+            json.dump(entry, fd, separators=(",", ":"))
+        os.replace(tmp_path, path)
+        self.evict()
+
+    def evict(self) -> None:
+        entries = [os.path.join(self.directory, name)
+                    for name in os.listdir(self.directory) if name.endswith(".json")]
+        if len(entries) <= self.max_entries:
+            return
+        entries.sort(key=lambda path: os.stat(path).st_mtime_ns)
+        for path in entries[:len(entries) - self.max_entries]:
+            os.unlink(path)
+
+    def solve(self, problem: Problem, time_limit: typing.Optional[float] = None) -> bool:
+        # As solve.solve, but the schedule comes from the cache if possible
+        optimal = self.get(problem)
+        if optimal is None:
+            solver = solve.Solver(problem, time_limit=time_limit)
+            optimal = solver.solve()
+            if not solver.timed_out:
+                self.put(problem, optimal)
+        return optimal
@@ -1,10 +1,14 @@
 
+import typing
 import collections
 import sys
 import json
 import os
-from problem import Problem, MAX_NAMES, Cell, Spreadsheet
-from solve import solve
+from problem import Problem
+from cache import SolutionCache
+from bounds import lower_bound
+from sheets import SheetsClient, QuotaError, Values, ValueRange
+from watch import Watcher
 
 from google.auth.transport.requests import Request      # type: ignore
 from google.oauth2.credentials import Credentials       # type: ignore
@@ -15,13 +19,37 @@ from googleapiclient.errors import HttpError            # type: ignore
 # If modifying these scopes, delete the file token.json.
 SCOPES = ['https://www.googleapis.com/auth/spreadsheets']
 
+# Seconds to search for the fewest rounds before settling for a good schedule
+TIME_LIMIT = 60.0
 
+# Solutions are remembered here, so that an unchanged input is not solved again
+CACHE_DIRECTORY = "solution_cache"
 
-def cell_name_fn(cell: Cell) -> str:
-    (column, row) = cell
-    return "R{}C{}".format(row + 1, column + 1)
+# HTTP status for requests rejected because of the quota
+TOO_MANY_REQUESTS = 429
 
-def main() -> None:
+class GoogleTransport:
+    def __init__(self, service: typing.Any) -> None:
+        self.values = service.spreadsheets().values()
+
+    def execute(self, request: typing.Any) -> typing.Any:
+        try:
+            return request.execute()
+        except HttpError as err:
+            if err.resp.status == TOO_MANY_REQUESTS:
+                raise QuotaError(str(err)) from err
+            raise
+
+    def batch_get(self, spreadsheet_id: str, ranges: typing.List[str]) -> typing.List[Values]:
+        result = self.execute(self.values.batchGet(
+                spreadsheetId=spreadsheet_id, ranges=ranges))
+        return [vr.get('values', []) for vr in result.get('valueRanges', [])]
+
+    def batch_update(self, spreadsheet_id: str, data: typing.List[ValueRange]) -> None:
+        self.execute(self.values.batchUpdate(spreadsheetId=spreadsheet_id,
+                body={"valueInputOption": "RAW", "data": data}))
+
+def main(watch: bool = False) -> None:
     spreadsheet_id = open("spreadsheet.id", "rt").read().strip()
 
     creds = None
@@ -43,37 +71,31 @@ def main() -> None:
     try:
         service = build('sheets', 'v4', credentials=creds)
 
-        # Call the Sheets API
-        sheet = service.spreadsheets()
-
-        # Get a copy of the sheet
-        result = sheet.values().get(spreadsheetId=spreadsheet_id,
-                range="Input!{}:{}".format(
-                        cell_name_fn((0, 0)),
-                        cell_name_fn((MAX_NAMES + 1, MAX_NAMES)))).execute()
-        values = Spreadsheet(result.get('values', []))
-       
-        problem = Problem.from_spreadsheet(values, cell_name_fn)
-        assert problem.validate_problem()
-        json.dump(problem.to_dict(), open("live_input.json", "wt"), indent=4)
-        solve(problem)
-        values = problem.to_spreadsheet()
-        assert problem.validate_solution()
-
-        sheet.values().update(spreadsheetId=spreadsheet_id,
-                range="Output!{}:{}".format(
-                        cell_name_fn((0, 0)),
-                        cell_name_fn(values.get_bottom_right())),
-                valueInputOption="RAW",
-                body={"values": values.values}).execute()
-
-
-        print(problem.to_text())
-        json.dump(problem.to_dict(), open("solution.json", "wt"), indent=4)
-
+        client = SheetsClient(GoogleTransport(service), spreadsheet_id)
+
+        def on_input(problem: Problem) -> None:
+            json.dump(problem.to_dict(), open("live_input.json", "wt"), indent=4)
+
+        def on_update(problem: Problem, optimal: bool) -> None:
+            print(problem.to_text(lower_bound(problem)))
+            if not optimal:
+                print("The number of rounds may not be the minimum.")
+            json.dump(problem.to_dict(), open("solution.json", "wt"), indent=4)
+
+        # The output is only written when the input has changed, and then
+        # only the cells which differ
+        watcher = Watcher(client, SolutionCache(CACHE_DIRECTORY),
+                          time_limit=TIME_LIMIT, on_input=on_input, on_update=on_update,
+                          transient=(HttpError, OSError))
+        if watch:
+            # Keep the service and the solver's caches, and update the
+            # output whenever the input changes
+            watcher.run()
+        else:
+            watcher.poll()
 
-    except HttpError as err:
+    except (HttpError, QuotaError) as err:
         print(err)
 
 if __name__ == '__main__':
-    main()
+    main(watch=("--watch" in sys.argv[1:]))
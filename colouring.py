@@ -0,0 +1,164 @@
+import typing
+
+from problem import Problem, Person, NOBODY
+
+# Problem 2 as edge colouring: the people who are present are the vertices,
+# each meeting which still has to happen is an edge, and each colour is a
+# round. Misra & Gries' constructive proof of Vizing's theorem colours the
+# edges one at a time with at most D + 1 colours, where D is the largest
+# number of meetings that any one person still needs. There is no search:
+# each edge is coloured in O(N) steps. The free colours at each vertex are
+# also kept as a bitmask, so each step of the fan is a single AND.
+
+Edge = typing.Tuple[int, int]
+
+class EdgeColouring:
+    def __init__(self, num_vertices: int, num_colours: int) -> None:
+        self.num_vertices = num_vertices
+        self.num_colours = num_colours
+        # at[v][c] is the vertex joined to v by the edge of colour c, or -1
+        self.at: typing.List[typing.List[int]] = [
+                [-1 for c in range(num_colours)] for v in range(num_vertices)]
+        self.colours: typing.Dict[Edge, int] = dict()
+        # free[v] has bit c set if colour c is free at v
+        self.free: typing.List[int] = [(1 << num_colours) - 1 for v in range(num_vertices)]
+
+    def add_colour(self) -> int:
+        for v in range(self.num_vertices):
+            self.at[v].append(-1)
+            self.free[v] |= 1 << self.num_colours
+        self.num_colours += 1
+        return self.num_colours - 1
+
+    def get_colour(self, u: int, v: int) -> int:
+        return self.colours.get((min(u, v), max(u, v)), -1)
+
+    def set_colour(self, u: int, v: int, c: int) -> None:
+        assert self.is_free(u, c) and self.is_free(v, c)
+        self.colours[(min(u, v), max(u, v))] = c
+        self.at[u][c] = v
+        self.at[v][c] = u
+        self.free[u] ^= 1 << c
+        self.free[v] ^= 1 << c
+
+    def clear_colour(self, u: int, v: int) -> int:
+        c = self.colours.pop((min(u, v), max(u, v)))
+        self.at[u][c] = -1
+        self.at[v][c] = -1
+        self.free[u] |= 1 << c
+        self.free[v] |= 1 << c
+        return c
+
+    def is_free(self, v: int, c: int) -> bool:
+        return self.at[v][c] < 0
+
+    def free_colour(self, v: int) -> int:
+        free = self.free[v]
+        if free == 0:
+            raise ValueError("No free colour at vertex {}".format(v))
+        return (free & -free).bit_length() - 1
+
+    def maximal_fan(self, u: int, v: int) -> typing.List[int]:
+        # Each edge (u, fan[i + 1]) has a colour which is free on fan[i].
+        # todo holds the colours of the edges at u which aren't in the fan,
+        # so the colours which can extend it are todo & free[tip], and the
+        # lowest of them is taken.
+        fan = [v]
+        todo = ((1 << self.num_colours) - 1) & ~self.free[u]
+        while True:
+            extend = todo & self.free[fan[-1]]
+            if extend == 0:
+                return fan
+            c = (extend & -extend).bit_length() - 1
+            fan.append(self.at[u][c])
+            todo ^= 1 << c
+
+    def path(self, u: int, c: int, d: int) -> typing.List[int]:
+        # Vertices on the path which starts at u with colour d, then c, d, ...
+        # (c must be free at u, so the path can't return to u)
+        vertices = [u]
+        (x, col) = (u, d)
+        while self.at[x][col] >= 0:
+            x = self.at[x][col]
+            vertices.append(x)
+            col = c if col == d else d
+        return vertices
+
+    def invert_path(self, u: int, c: int, d: int) -> None:
+        # Swap colours c and d on the path which starts at u with colour d
+        path: typing.List[typing.Tuple[int, int, int]] = []
+        (x, col) = (u, d)
+        while self.at[x][col] >= 0:
+            y = self.at[x][col]
+            path.append((x, y, col))
+            x = y
+            col = c if col == d else d
+
+        for (x, y, col) in path:
+            self.clear_colour(x, y)
+        for (x, y, col) in path:
+            self.set_colour(x, y, c if col == d else d)
+
+    def colour_edge(self, u: int, v: int) -> int:
+        assert self.get_colour(u, v) < 0
+        fan = self.maximal_fan(u, v)
+        c = self.free_colour(u)
+        d = self.free_colour(fan[-1])
+        self.invert_path(u, c, d)
+
+        # Find w in the fan such that fan[:w + 1] is still a fan and d is free on w
+        w = -1
+        for i in range(len(fan)):
+            if (i > 0) and not self.is_free(fan[i - 1], self.get_colour(u, fan[i])):
+                break
+            if self.is_free(fan[i], d):
+                w = i
+                break
+        assert w >= 0
+
+        # Rotate the fan up to w, then colour (u, fan[w]) with d
+        for i in range(w):
+            col = self.clear_colour(u, fan[i + 1])
+            self.set_colour(u, fan[i], col)
+        self.set_colour(u, fan[w], d)
+        return d
+
+def colour_edges(num_vertices: int, edges: typing.List[Edge]) -> EdgeColouring:
+    degree = [0 for v in range(num_vertices)]
+    for (u, v) in edges:
+        degree[u] += 1
+        degree[v] += 1
+
+    colouring = EdgeColouring(num_vertices, max(degree, default=0) + 1)
+    for (u, v) in edges:
+        colouring.colour_edge(u, v)
+    return colouring
+
+def solve_by_colouring(problem: Problem) -> None:
+    problem.reset()
+    people = [p for p in problem.people if p.is_present]
+    index: typing.Dict[Person, int] = dict()
+    for (i, p) in enumerate(people):
+        index[p] = i
+
+    already_met: typing.Set[Edge] = set()
+    for (i, p1) in enumerate(people):
+        for p2 in p1.already_met:
+            j = index.get(p2, -1)
+            if j >= 0:
+                already_met.add((min(i, j), max(i, j)))
+
+    edges = [(i, j) for i in range(len(people)) for j in range(i + 1, len(people))
+                if (i, j) not in already_met]
+    colouring = colour_edges(len(people), edges)
+
+    # Each colour which was used becomes a round
+    for c in range(colouring.num_colours):
+        meetings = [colouring.at[i][c] for i in range(len(people))]
+        if max(meetings, default=-1) < 0:
+            continue
+        for (i, p1) in enumerate(people):
+            if meetings[i] < 0:
+                p1.schedule.append(NOBODY)
+            else:
+                p1.schedule.append(people[meetings[i]])
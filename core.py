@@ -0,0 +1,120 @@
+import typing
+import array
+
+from problem import Problem, Person, NOBODY
+
+# Compact, integer-indexed form of a Problem, for storing and sending
+# large problems (binary.py writes it to a file). It is a separate format,
+# not the model: Person and Problem keep their lists of Person references,
+# which the spreadsheet and JSON code, the solvers and the tests use, and a
+# Core is made from them, or turned back into them, in O(N + E) time (E is
+# the number of already_met entries):
+#
+# * people are numbered 0 .. N - 1, in the order given;
+# * the met relation is a packed lower triangular bit array: the bit for
+#   i > j is at (i * (i - 1)) // 2 + j, so row i is one run of i bits;
+# * the schedule is an array('i') of rounds x people, holding the number
+#   of the person met, or NOT_MET.
+#
+# For N people this is N * N / 16 bytes for the met relation and 4 bytes
+# per person per round, rather than a list entry (8 bytes) per meeting
+# and per round, plus the lists themselves. That saving is only made while
+# a problem is stored: once it is turned back into a Problem, the lists
+# are made again.
+
+NOT_MET = -1
+
+def triangle_index(i: int, j: int) -> int:
+    if i < j:
+        (i, j) = (j, i)
+    assert i > j
+    return ((i * (i - 1)) // 2) + j
+
+class Core:
+    __slots__ = ["num_people", "names", "present", "met", "num_rounds", "schedule"]
+
+    def __init__(self, num_people: int, num_rounds: int = 0) -> None:
+        self.num_people = num_people
+        self.names: typing.List[str] = ["" for i in range(num_people)]
+        self.present = bytearray(num_people)
+        self.met = bytearray((((num_people * (num_people - 1)) // 2) + 7) // 8)
+        self.num_rounds = num_rounds
+        self.schedule = array.array("i", [NOT_MET]) * (num_rounds * num_people)
+
+    def is_met(self, i: int, j: int) -> bool:
+        k = triangle_index(i, j)
+        return bool(self.met[k >> 3] & (1 << (k & 7)))
+
+    def set_met(self, i: int, j: int) -> None:
+        k = triangle_index(i, j)
+        self.met[k >> 3] |= 1 << (k & 7)
+
+    def met_masks(self) -> typing.List[int]:
+        # One bitmask per person: bit j of masks[i] is set if i has met j
+        packed = int.from_bytes(self.met, "little")
+        masks = [0 for i in range(self.num_people)]
+        for i in range(1, self.num_people):
+            row = (packed >> triangle_index(i, 0)) & ((1 << i) - 1)
+            masks[i] |= row
+            bit = 1 << i
+            while row:
+                low = row & -row
+                masks[low.bit_length() - 1] |= bit
+                row ^= low
+        return masks
+
+    def partner(self, r: int, i: int) -> int:
+        return self.schedule[(r * self.num_people) + i]
+
+    def set_partner(self, r: int, i: int, j: int) -> None:
+        self.schedule[(r * self.num_people) + i] = j
+
+    @staticmethod
+    def from_people(people: typing.List[Person]) -> "Core":
+        # already_met and schedule entries for people not in the list are ignored
+        index: typing.Dict[Person, int] = dict()
+        for (i, p1) in enumerate(people):
+            index[p1] = i
+
+        num_rounds = max([len(p1.schedule) for p1 in people], default=0)
+        self = Core(len(people), num_rounds)
+        met = self.met
+        for (i, p1) in enumerate(people):
+            self.names[i] = p1.name
+            self.present[i] = p1.is_present
+            row = (i * (i - 1)) // 2
+            for p2 in p1.already_met:
+                j = index.get(p2, i)
+                if j < i:
+                    # set_met(i, j), for each pair in the lower triangle
+                    k = row + j
+                    met[k >> 3] |= 1 << (k & 7)
+                elif j > i:
+                    self.set_met(i, j)
+            for (r, p2) in enumerate(p1.schedule):
+                self.set_partner(r, i, index.get(p2, NOT_MET))
+        return self
+
+    @staticmethod
+    def from_problem(problem: Problem) -> "Core":
+        return Core.from_people(problem.people)
+
+    def to_problem(self) -> Problem:
+        problem = Problem()
+        people = problem.people
+        for i in range(self.num_people):
+            people.append(Person(self.names[i], bool(self.present[i])))
+
+        masks = self.met_masks()
+        for (i, p1) in enumerate(people):
+            mask = masks[i]
+            while mask:
+                low = mask & -mask
+                p1.already_met.append(people[low.bit_length() - 1])
+                mask ^= low
+
+            if p1.is_present:
+                for r in range(self.num_rounds):
+                    j = self.partner(r, i)
+                    p1.schedule.append(NOBODY if j == NOT_MET else people[j])
+        return problem
@@ -0,0 +1,137 @@
+import typing
+
+# Knuth's Algorithm X on a dancing links structure. Each column is a
+# constraint which must be satisfied exactly once, each row is a choice
+# which satisfies some columns. For the pairs problem, the columns are
+# the people in a round and the rows are the pairs who could meet, so
+# every exact cover is a perfect matching (a complete round).
+#
+# Covering and uncovering a column is O(1) per link, and the column with
+# the fewest remaining rows is always tried first (minimum remaining
+# values), which is where most of the pruning comes from. Ties go to the
+# leftmost column, and rows are tried in the order they were given.
+
+Pair = typing.Tuple[int, int]
+Pairs = typing.List[Pair]
+
+class DancingLinks:
+    def __init__(self, num_columns: int, rows: typing.List[typing.List[int]]) -> None:
+        # Node 0 is the root, nodes 1 .. num_columns are the column headers
+        size = num_columns + 1
+        self.left = [(i - 1) % size for i in range(size)]
+        self.right = [(i + 1) % size for i in range(size)]
+        self.up = list(range(size))
+        self.down = list(range(size))
+        self.column = list(range(size))
+        self.row = [-1 for i in range(size)]
+        self.count = [0 for i in range(size)]
+
+        for (r, columns) in enumerate(rows):
+            first = -1
+            for c in columns:
+                node = len(self.column)
+                header = c + 1
+                self.column.append(header)
+                self.row.append(r)
+                self.count[header] += 1
+
+                # Insert at the bottom of the column
+                self.up.append(self.up[header])
+                self.down.append(header)
+                self.down[self.up[header]] = node
+                self.up[header] = node
+
+                # Insert at the end of the row
+                if first < 0:
+                    first = node
+                    self.left.append(node)
+                    self.right.append(node)
+                else:
+                    self.left.append(self.left[first])
+                    self.right.append(first)
+                    self.right[self.left[first]] = node
+                    self.left[first] = node
+
+    def cover(self, c: int) -> None:
+        self.right[self.left[c]] = self.right[c]
+        self.left[self.right[c]] = self.left[c]
+        i = self.down[c]
+        while i != c:
+            j = self.right[i]
+            while j != i:
+                self.down[self.up[j]] = self.down[j]
+                self.up[self.down[j]] = self.up[j]
+                self.count[self.column[j]] -= 1
+                j = self.right[j]
+            i = self.down[i]
+
+    def uncover(self, c: int) -> None:
+        i = self.up[c]
+        while i != c:
+            j = self.left[i]
+            while j != i:
+                self.count[self.column[j]] += 1
+                self.down[self.up[j]] = j
+                self.up[self.down[j]] = j
+                j = self.left[j]
+            i = self.up[i]
+        self.right[self.left[c]] = c
+        self.left[self.right[c]] = c
+
+    def choose_column(self) -> int:
+        best = self.right[0]
+        c = self.right[best]
+        while c != 0:
+            if self.count[c] < self.count[best]:
+                best = c
+            c = self.right[c]
+        return best
+
+    def solutions(self, visit: typing.Optional[typing.Callable[[], None]] = None
+                    ) -> typing.Iterator[typing.List[int]]:
+        # Yields every exact cover as a list of row numbers. visit is called
+        # at each node of the search, and may raise an exception to stop it.
+        chosen: typing.List[int] = []
+
+        def search() -> typing.Iterator[typing.List[int]]:
+            if visit is not None:
+                visit()
+            if self.right[0] == 0:
+                yield chosen[:]
+                return
+
+            c = self.choose_column()
+            if self.count[c] == 0:
+                return
+
+            self.cover(c)
+            i = self.down[c]
+            while i != c:
+                chosen.append(self.row[i])
+                j = self.right[i]
+                while j != i:
+                    self.cover(self.column[j])
+                    j = self.right[j]
+
+                yield from search()
+
+                j = self.left[i]
+                while j != i:
+                    self.uncover(self.column[j])
+                    j = self.left[j]
+                chosen.pop()
+                i = self.down[i]
+            self.uncover(c)
+
+        return search()
+
+def perfect_matchings(people: typing.List[int], pairs: Pairs,
+            visit: typing.Optional[typing.Callable[[], None]] = None) -> typing.Iterator[Pairs]:
+    # Every way to pair up all of the people, using only the given pairs
+    column: typing.Dict[int, int] = dict()
+    for p in people:
+        column[p] = len(column)
+
+    rows = [[column[a], column[b]] for (a, b) in pairs]
+    for solution in DancingLinks(len(column), rows).solutions(visit):
+        yield [pairs[r] for r in solution]
@@ -0,0 +1,114 @@
+import typing
+
+# Maximum cardinality matching on an arbitrary graph using Edmonds'
+# blossom algorithm. Vertices are numbered 0 .. N-1 and the numbering
+# is also the order of preference: a greedy matching is formed first,
+# taking the smallest available partner for each vertex in turn, then it
+# is extended by augmenting paths, which are also searched in vertex
+# order. Each augmenting path is found in O(N^2) so a round costs O(N^3).
+
+Neighbours = typing.List[typing.List[int]]
+
+class Blossom:
+    def __init__(self, neighbours: Neighbours) -> None:
+        self.neighbours = neighbours
+        self.num_vertices = len(neighbours)
+        self.mate: typing.List[int] = [-1 for i in range(self.num_vertices)]
+        self.parent: typing.List[int] = []
+        self.base: typing.List[int] = []
+        self.used: typing.List[bool] = []
+        self.blossom: typing.List[bool] = []
+        self.queue: typing.List[int] = []
+
+    def greedy(self) -> None:
+        for v in range(self.num_vertices):
+            if self.mate[v] < 0:
+                for to in self.neighbours[v]:
+                    if self.mate[to] < 0:
+                        self.mate[v] = to
+                        self.mate[to] = v
+                        break
+
+    def lowest_common_ancestor(self, a: int, b: int) -> int:
+        seen = [False for i in range(self.num_vertices)]
+        while True:
+            a = self.base[a]
+            seen[a] = True
+            if self.mate[a] < 0:
+                break
+            a = self.parent[self.mate[a]]
+
+        while True:
+            b = self.base[b]
+            if seen[b]:
+                return b
+            b = self.parent[self.mate[b]]
+
+    def mark_path(self, v: int, b: int, child: int) -> None:
+        while self.base[v] != b:
+            self.blossom[self.base[v]] = True
+            self.blossom[self.base[self.mate[v]]] = True
+            self.parent[v] = child
+            child = self.mate[v]
+            v = self.parent[self.mate[v]]
+
+    def contract(self, v: int, to: int) -> None:
+        # v and to are both on even levels, so the cycle through
+        # their common ancestor is shrunk into a single vertex
+        b = self.lowest_common_ancestor(v, to)
+        self.blossom = [False for i in range(self.num_vertices)]
+        self.mark_path(v, b, to)
+        self.mark_path(to, b, v)
+        for i in range(self.num_vertices):
+            if self.blossom[self.base[i]]:
+                self.base[i] = b
+                if not self.used[i]:
+                    self.used[i] = True
+                    self.queue.append(i)
+
+    def find_path(self, root: int) -> int:
+        # Breadth-first search for an augmenting path starting at root.
+        # Returns the free vertex at the other end, or -1.
+        self.used = [False for i in range(self.num_vertices)]
+        self.parent = [-1 for i in range(self.num_vertices)]
+        self.base = list(range(self.num_vertices))
+        self.used[root] = True
+        self.queue = [root]
+        head = 0
+        while head < len(self.queue):
+            v = self.queue[head]
+            head += 1
+            for to in self.neighbours[v]:
+                if (self.base[v] == self.base[to]) or (self.mate[v] == to):
+                    continue
+                if ((to == root) or
+                        ((self.mate[to] >= 0) and (self.parent[self.mate[to]] >= 0))):
+                    self.contract(v, to)
+                elif self.parent[to] < 0:
+                    self.parent[to] = v
+                    if self.mate[to] < 0:
+                        return to
+                    self.used[self.mate[to]] = True
+                    self.queue.append(self.mate[to])
+        return -1
+
+    def augment(self, v: int) -> None:
+        while v >= 0:
+            pv = self.parent[v]
+            ppv = self.mate[pv]
+            self.mate[v] = pv
+            self.mate[pv] = v
+            v = ppv
+
+    def solve(self) -> typing.List[int]:
+        self.greedy()
+        for root in range(self.num_vertices):
+            if self.mate[root] < 0:
+                v = self.find_path(root)
+                if v >= 0:
+                    self.augment(v)
+        return self.mate
+
+def max_matching(neighbours: Neighbours) -> typing.List[int]:
+    # Returns the partner of each vertex, or -1 if unmatched
+    return Blossom(neighbours).solve()
@@ -0,0 +1,39 @@
+import typing
+import collections
+
+# Transposition table for the backtracking searches. The same state (for
+# example, the set of people who are still free in a round) is often
+# reached through different orders of earlier choices, and if the search
+# from that state failed once, it will fail again. Only failures are
+# recorded. The table holds at most "capacity" states, and when it is
+# full, the state which was least recently added or found is forgotten.
+
+DEFAULT_CAPACITY = 1 << 16
+
+class TranspositionTable:
+    def __init__(self, capacity: int = DEFAULT_CAPACITY) -> None:
+        assert capacity > 0
+        self.capacity = capacity
+        self.failed: typing.OrderedDict[typing.Hashable, None] = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __contains__(self, key: typing.Hashable) -> bool:
+        if key in self.failed:
+            self.failed.move_to_end(key)
+            self.hits += 1
+            return True
+        self.misses += 1
+        return False
+
+    def __len__(self) -> int:
+        return len(self.failed)
+
+    def add(self, key: typing.Hashable) -> None:
+        self.failed[key] = None
+        self.failed.move_to_end(key)
+        if len(self.failed) > self.capacity:
+            self.failed.popitem(last=False)
+
+    def clear(self) -> None:
+        self.failed.clear()
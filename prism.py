@@ -1,10 +1,12 @@
 import typing
+import random
 import sys
 
 
 Pair = typing.Tuple[int, int]
 Pairs = typing.List[Pair]
 Choice = typing.Tuple[typing.Any, int, int, int]
+ChoiceKey = typing.Tuple[int, int, int]
 
 class CantSolveError(Exception):
     pass
@@ -17,7 +19,8 @@ class Cell:
         self.busy = False
 
 class Slice:
-    def __init__(self, z: int, num_people: int) -> None:
+    def __init__(self, z: int, num_people: int,
+                    rng: typing.Optional[random.Random] = None) -> None:
         self.z = z
         self.num_people = num_people
         self.pairs: Pairs = []
@@ -26,23 +29,44 @@ class Slice:
             for y in range(x):
                 self.grid[(x, y)] = Cell(x, y)
 
+        # Number of cells in each person's row and column which are not busy
+        self.availability = [num_people - 1 for i in range(num_people)]
+
+        # Changes since the last call to update_choices
+        self.removed: Pairs = []
+        self.dirty: typing.Set[int] = set()
+
+        # With a random number generator, ties in availability
+        # are broken randomly rather than by (z, y, x)
+        self.rng = rng
+        self.tie_break: typing.Dict[Pair, float] = dict()
+        if rng is not None:
+            for x in range(1, num_people):
+                for y in range(x):
+                    self.tie_break[(x, y)] = rng.random()
+
+    def set_busy(self, cell: Cell) -> None:
+        if not cell.busy:
+            cell.busy = True
+            self.availability[cell.x] -= 1
+            self.availability[cell.y] -= 1
+            self.removed.append((cell.x, cell.y))
+            self.dirty.add(cell.x)
+            self.dirty.add(cell.y)
+
     def visit_related(self, cr: int, mark_busy: bool) -> int:
         assert 0 <= cr < self.num_people
-        count = 0
+        count = self.availability[cr]
+        if not mark_busy:
+            return count
 
         # Column cr, downwards (height of column cr is cr)
         for i in range(cr):
-            if not self.grid[(cr, i)].busy:
-                count += 1
-            if mark_busy:
-                self.grid[(cr, i)].busy = True
+            self.set_busy(self.grid[(cr, i)])
 
         # Row y, across
         for i in range(cr + 1, self.num_people):
-            if not self.grid[(i, cr)].busy:
-                count += 1
-            if mark_busy:
-                self.grid[(i, cr)].busy = True
+            self.set_busy(self.grid[(i, cr)])
 
         return count
 
@@ -57,7 +81,7 @@ class Slice:
 
     def set_met_elsewhere(self, x: int, y: int) -> None:
         self.grid[(x, y)].met = True
-        self.grid[(x, y)].busy = True
+        self.set_busy(self.grid[(x, y)])
 
     def set_met(self, x: int, y: int) -> None:
         assert 0 <= y < x < self.num_people
@@ -96,27 +120,112 @@ class Slice:
         out.append("\n")
         return "".join(out)
 
+    def choice(self, x: int, y: int) -> Choice:
+        assert not self.grid[(x, y)].met
+        (a, b) = self.calculate_availability(x, y)
+
+        # For original algorithm, use value = (y, x) here
+        # Availability: value = (a, b, y, x)
+        value: typing.Tuple[typing.Any, ...] = (a, b, self.z, y, x)
+        if self.rng is not None:
+            value = (a, b, self.tie_break[(x, y)], self.z, y, x)
+        return (value, x, y, self.z)
+
     def find_choices(self) -> typing.List[Choice]:
         available: typing.List[Choice] = []
         for y in range(self.num_people - 1):
             for x in range(y + 1, self.num_people):
                 if not self.grid[(x, y)].busy:
-                    assert not self.grid[(x, y)].met
-                    (a, b) = self.calculate_availability(x, y)
-
-                    # For original algorithm, use value = (y, x) here
-                    # Availability: value = (a, b, y, x)
-                    value = (a, b, self.z, y, x)
-                    available.append((value, x, y, self.z))
+                    available.append(self.choice(x, y))
 
         return available
 
+    def update_choices(self, heap: "ChoiceHeap") -> None:
+        # Remove choices which became busy, and rescore the choices
+        # of everyone whose availability changed
+        for (x, y) in self.removed:
+            heap.remove((x, y, self.z))
+
+        for cr in self.dirty:
+            for i in range(cr):
+                if not self.grid[(cr, i)].busy:
+                    heap.update(self.choice(cr, i))
+            for i in range(cr + 1, self.num_people):
+                if not self.grid[(i, cr)].busy:
+                    heap.update(self.choice(i, cr))
+
+        self.removed.clear()
+        self.dirty.clear()
+
+class ChoiceHeap:
+    # Binary heap of choices, indexed by (x, y, z) so that the
+    # value of a choice can be changed, or the choice removed, in O(log n)
+    def __init__(self) -> None:
+        self.heap: typing.List[Choice] = []
+        self.index: typing.Dict[ChoiceKey, int] = dict()
+
+    def __len__(self) -> int:
+        return len(self.heap)
+
+    def first(self) -> Choice:
+        return self.heap[0]
+
+    def update(self, choice: Choice) -> None:
+        # Adds a choice, or changes its value. In Prism.fill, availability
+        # never increases, so an existing choice only moves up.
+        (_, x, y, z) = choice
+        i = self.index.get((x, y, z))
+        if i is None:
+            i = len(self.heap)
+            self.heap.append(choice)
+        elif self.heap[i] < choice:
+            self.sift_down(i, choice)
+            return
+        self.sift_up(i, choice)
+
+    def remove(self, key: ChoiceKey) -> None:
+        i = self.index.pop(key)
+        last = self.heap.pop()
+        if i < len(self.heap):
+            if (i > 0) and (last < self.heap[(i - 1) // 2]):
+                self.sift_up(i, last)
+            else:
+                self.sift_down(i, last)
+
+    def place(self, i: int, choice: Choice) -> None:
+        self.heap[i] = choice
+        (_, x, y, z) = choice
+        self.index[(x, y, z)] = i
+
+    def sift_up(self, i: int, choice: Choice) -> None:
+        while i > 0:
+            parent = (i - 1) // 2
+            if self.heap[parent] <= choice:
+                break
+            self.place(i, self.heap[parent])
+            i = parent
+        self.place(i, choice)
+
+    def sift_down(self, i: int, choice: Choice) -> None:
+        size = len(self.heap)
+        while True:
+            child = (2 * i) + 1
+            if child >= size:
+                break
+            if ((child + 1) < size) and (self.heap[child + 1] < self.heap[child]):
+                child += 1
+            if choice <= self.heap[child]:
+                break
+            self.place(i, self.heap[child])
+            i = child
+        self.place(i, choice)
+
 class Prism:
-    def __init__(self, num_people: int) -> None:
+    def __init__(self, num_people: int, rng: typing.Optional[random.Random] = None) -> None:
         self.num_people = num_people
         self.slices: typing.List[Slice] = []
         for z in range(num_people - 1):
-            self.slices.append(Slice(z, num_people))
+            self.slices.append(Slice(z, num_people, rng))
 
     def find_choices(self) -> typing.List[Choice]:
         available: typing.List[Choice] = []
@@ -126,16 +235,25 @@ class Prism:
         return available
 
     def fill(self) -> None:
+        # The choices are kept in a heap, and after each placement only
+        # the choices whose availability changed are updated
+        heap = ChoiceHeap()
+        for choice in self.find_choices():
+            heap.update(choice)
+        for s in self.slices:
+            s.removed.clear()
+            s.dirty.clear()
+
         todo_count = (self.num_people // 2) * (self.num_people - 1)
         while todo_count > 0:
             todo_count -= 1
-            available = self.find_choices()
-            if len(available) == 0:
+            if len(heap) == 0:
                 raise CantSolveError()
-            (_, x, y, z) = min(available)
+            (_, x, y, z) = heap.first()
             self.slices[z].set_met(x, y)
             for s in self.slices:
                 s.set_met_elsewhere(x, y)
+                s.update_choices(heap)
 
     def check(self) -> None:
         all_pairs: Pairs = []
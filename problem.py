@@ -1,16 +1,50 @@
 
 import typing
+import itertools
 
 IS_PRESENT = "IS PRESENT"
 ROUND = "round "
-MAX_NAMES = 24
 
 Cell = typing.Tuple[int, int]
 
 class CaptureError(Exception):
     pass
 
+class Violation:
+    # The first reason why a Problem or its solution is not valid
+    def __init__(self, reason: str, person: typing.Optional["Person"] = None,
+                    other: typing.Optional["Person"] = None,
+                    round_number: typing.Optional[int] = None) -> None:
+        self.reason = reason
+        self.person = person
+        self.other = other
+        self.round_number = round_number
+
+    def __str__(self) -> str:
+        out = self.reason
+        if self.person is not None:
+            out = "{}: {}".format(self.person.name, out)
+        if self.other is not None:
+            out += " ({})".format(self.other.name)
+        if self.round_number is not None:
+            out += " in round {}".format(self.round_number + 1)
+        return out
+
+class Bound:
+    # A lower bound on the number of rounds (see bounds.py)
+    def __init__(self, rounds: int, reason: str, people: typing.List["Person"]) -> None:
+        self.rounds = rounds
+        self.reason = reason
+        self.people = people
+
+    def __str__(self) -> str:
+        return "at least {} rounds: {}".format(self.rounds, self.reason)
+
 class Person:
+    # Many Person objects are made for large classes (see core.py for a
+    # compact form, used for storage)
+    __slots__ = ["name", "is_present", "already_met", "schedule"]
+
     def __init__(self, name: str, is_present: bool) -> None:
         self.name = name
         self.is_present = is_present
@@ -79,50 +113,64 @@ class Problem:
         return self.validate(problem_only=False)
 
     def validate(self, problem_only: bool) -> bool:
-        all_people = set(self.people)
-        names_seen: typing.Set[str] = set()
+        return self.find_violation(problem_only) is None
+
+    def find_violation(self, problem_only: bool) -> typing.Optional["Violation"]:
+        # Returns the first problem found, or None if valid. People are
+        # numbered, and each check is a lookup in an array or a set of
+        # numbers, so this is O(N * (N + R)) for N people and R rounds.
+        index: typing.Dict[Person, int] = dict()
+        for (i, p1) in enumerate(self.people):
+            index[p1] = i
+        num_people = len(self.people)
 
         # The people list elements must be unique
-        if len(all_people) != len(self.people):
-            return False
+        if len(index) != num_people:
+            return Violation("the same person appears twice in the list")
+
+        # seen[j] == i + 1 if person i has met person j
+        seen = [0 for p1 in self.people]
+        already_met: typing.Set[int] = set()
+        names_seen: typing.Set[str] = set()
 
         # Check each person individually
-        for p1 in self.people:
-            met = set()
-            met.add(p1)
+        for (i, p1) in enumerate(self.people):
             if p1 is NOBODY:
-                return False
+                return Violation("NOBODY is in the list")
 
+            mark = i + 1
+            seen[i] = mark
+            count = 1
             for p2 in p1.already_met:
-                if not (p2 in all_people):
-                    # Already met someone we don't know
-                    return False
-                if p2 in met:
-                    # Already met someone twice
-                    return False
-                met.add(p2)
-
-            for p2 in p1.schedule:
+                j = index.get(p2, -1)
+                if j < 0:
+                    return Violation("already met someone unknown", p1, p2)
+                if seen[j] == mark:
+                    return Violation("already met someone twice", p1, p2)
+                seen[j] = mark
+                count += 1
+                already_met.add((i * num_people) + j)
+
+            for (r, p2) in enumerate(p1.schedule):
                 if p2 is NOBODY:
                     continue
                 if (not p1.is_present) or (not p2.is_present):
-                    # Met someone who isn't present
-                    return False
-                if not (p2 in all_people):
-                    # Met someone we don't know
-                    return False
-                if p2 in met:
-                    # Met someone twice
-                    return False
-                met.add(p2)
+                    return Violation("met someone who isn't present", p1, p2, r)
+                j = index.get(p2, -1)
+                if j < 0:
+                    return Violation("met someone unknown", p1, p2, r)
+                if seen[j] == mark:
+                    return Violation("met someone twice", p1, p2, r)
+                seen[j] = mark
+                count += 1
 
             # Each person should have met all other people once
-            if (met != all_people) and not problem_only:
-                return False
+            if (count != num_people) and not problem_only:
+                return Violation("hasn't met everyone", p1)
 
             # Person must have a valid name
             if (p1.name == "") or (p1.name == NOBODY.name) or (p1.name in names_seen):
-                return False
+                return Violation("invalid or duplicate name", p1)
 
             names_seen.add(p1.name)
 
@@ -136,55 +184,64 @@ class Problem:
         for p1 in self.people:
             if p1.is_present:
                 if size != len(p1.schedule):
-                    # Schedule size differs
-                    return False
+                    return Violation("schedule size differs", p1)
             else:
                 if 0 != len(p1.schedule):
-                    # Schedule size should be 0 when not present
-                    return False
+                    return Violation("schedule should be empty when not present", p1)
 
         # Check consistent schedule relationships
         for p1 in self.people:
-            for (i, p2) in enumerate(p1.schedule):
+            for (r, p2) in enumerate(p1.schedule):
                 if p2 is NOBODY:
                     continue
-                if p2.schedule[i] != p1:
-                    # p2 doesn't meet p1 at time i - schedule doesn't match
-                    return False
+                if p2.schedule[r] is not p1:
+                    return Violation("schedule doesn't match", p1, p2, r)
 
         # Check consistent already_met relationships
-        for p1 in self.people:
+        for (i, p1) in enumerate(self.people):
             for p2 in p1.already_met:
-                if not (p1 in p2.already_met):
-                    # p1 met p2, but p2 didn't meet p1?
-                    return False
-
-        return True
+                if ((index[p2] * num_people) + i) not in already_met:
+                    return Violation("already met is one-sided", p1, p2)
 
+        return None
 
     @staticmethod
     def from_spreadsheet(values: Spreadsheet,
                     cell_name_fn: typing.Callable[[Cell], str]) -> "Problem":
+        # The table is read directly from the row lists, in one pass, and
+        # its size is found from the data. Cell names are only made when
+        # there is an error to report.
+        rows = values.values
+
+        def cell(x: int, y: int) -> str:
+            if (0 <= y < len(rows)) and (0 <= x < len(rows[y])):
+                return rows[y][x]
+            return ""
+
         # Find start of table
-        (x, y) = values.get_bottom_right()
-        for start in range(y):
-            if values[(1, start)] == IS_PRESENT:
+        start = -1
+        for (y, row) in enumerate(rows[:-1]):
+            if (len(row) > 1) and (row[1] == IS_PRESENT):
+                start = y
                 break
 
-        if values[(1, start)] != IS_PRESENT:
+        if start < 0:
             raise CaptureError("Unable to find '{}' marker - "
                         "input is not valid".format(IS_PRESENT))
 
         # Capture names (and check for consistency)
+        header = rows[start]
         row_names = set()
-        for i in range(MAX_NAMES):
-            name = values[(0, i + 1 + start)]
+        names: typing.List[str] = []
+        while True:
+            i = len(names)
+            name = cell(0, i + 1 + start)
 
             if name.lower() in row_names:
                 raise CaptureError("Invalid name in cell {}: duplicate '{}'".format(
                             cell_name_fn((0, i + 1 + start)), name))
 
-            if values[(i + 2, start)] != name:
+            if (header[i + 2] if (i + 2) < len(header) else "") != name:
                 raise CaptureError("Invalid name '{}' in cell {} "
                     "- need this name to appear in cell {} too".format(
                             name, cell_name_fn((i + 2, start)),
@@ -193,20 +250,47 @@ class Problem:
                 break
 
             row_names.add(name.lower())
-        num_names = len(row_names)
+            names.append(name)
+        num_names = len(names)
+
+        # Rows of the table, padded to the same width, and its columns
+        width = num_names + 2
+        grid: typing.List[typing.List[str]] = []
+        for y in range(num_names):
+            row = rows[y + 1 + start]
+            if len(row) < width:
+                row = row + ([""] * (width - len(row)))
+            grid.append(row)
+        columns = list(zip(*[row[:width] for row in grid]))
 
         # Read presence values and create records for people
         self = Problem()
         people = self.people
         for y in range(num_names):
-            people.append(Person(name=values[(0, y + 1 + start)],
-                            is_present=is_truthy(values[(1, y + 1 + start)])))
+            people.append(Person(name=names[y], is_present=is_truthy(grid[y][1])))
 
-        # Find out who already talked to whom
+        # Find out who already talked to whom. Most cells are the same in
+        # both triangles (or "-" in the lower one), and there are few
+        # distinct values, so each value is only classified once: 0 for
+        # not met, 1 for met, 2 for anything else (e.g. a round number).
+        kind: typing.Dict[str, int] = dict()
         for y in range(num_names):
+            upper = grid[y]         # upper right triangle: row y
+            lower = columns[2 + y]  # lower left triangle: column y
             for x in range(y, num_names):
-                v = values[(2 + x, 1 + y + start)]  # upper right triangle
-                v2 = values[(2 + y, 1 + x + start)] # lower left triangle
+                v = upper[2 + x]
+                v2 = lower[x]
+                if (v2 == v) or (v2 == '-'):
+                    k = kind.get(v)
+                    if k is None:
+                        k = kind[v] = 1 if is_truthy(v) else (2 if v.startswith(ROUND) else 0)
+                    if k == 0:
+                        continue
+                    if (k == 1) and (x != y):
+                        people[x].already_met.append(people[y])
+                        people[y].already_met.append(people[x])
+                        continue
+
                 if x == y:
                     if is_truthy(v) or v.startswith(ROUND):
                         raise CaptureError(
@@ -245,85 +329,78 @@ class Problem:
 
         return self
 
-    def to_spreadsheet(self) -> Spreadsheet:
-        values = Spreadsheet([])
-
-        # Create round table
-        start = 0
-        size = 0
+    def spreadsheet_sizes(self) -> typing.Tuple[int, int]:
+        # Number of rounds, and the longest already met list
+        num_rounds = 0
+        num_met = 0
         for p1 in self.people:
             if p1.is_present:
-                size = max(size, len(p1.schedule))
+                num_rounds = max(num_rounds, len(p1.schedule))
+            num_met = max(num_met, len(p1.already_met))
+        return (num_rounds, num_met)
+
+    def spreadsheet_bottom_right(self) -> Cell:
+        # The bottom right cell of to_spreadsheet(), without making it:
+        # the round table, the already met table, the normalised copy of
+        # the input table, with two blank rows after each
+        (num_rounds, num_met) = self.spreadsheet_sizes()
+        height = (1 + num_rounds + 2) + (1 + num_met + 2) + (1 + len(self.people) + 2)
+        return (len(self.people) + 1, height - 1)
+
+    def spreadsheet_rows(self) -> typing.Iterator[typing.List[str]]:
+        # The rows of to_spreadsheet(), one at a time, each already padded
+        # to the full width. Only the rows themselves are N x N; the rest is
+        # O(N + E), so a writer can send each row on without keeping them.
+        (num_rounds, num_met) = self.spreadsheet_sizes()
+        num_people = len(self.people)
+        width = num_people + 2
+        names = [p1.name for p1 in self.people]
+        blank = [""] * width
+
+        # Round table
+        if num_rounds != 0:
+            yield ["", "SOLUTION"] + names
+        else:
+            yield blank[:]
+
+        for i in range(num_rounds):
+            row = ["", "{}{}".format(ROUND.title(), i + 1)]
+            for p1 in self.people:
+                p2 = p1.schedule[i] if i < len(p1.schedule) else NOBODY
+                row.append("-" if p2 is NOBODY else "{} + {}".format(p2.name, p1.name))
+            yield row
 
-        values[(0, start)] = ""
-        values[(1, start)] = ""
-        if size != 0:
-            values[(1, start)] = "SOLUTION"
-            for (i, p1) in enumerate(self.people):
-                values[(i + 2, start)] = p1.name
-
-        for i in range(size):
-            values[(1, start + i + 1)] = "{}{}".format(ROUND.title(), i + 1)
-            for (j, p1) in enumerate(self.people):
-                if i < len(p1.schedule):
-                    p2 = p1.schedule[i]
-                else:
-                    p2 = NOBODY
+        yield blank[:]
+        yield blank[:]
 
-                if p2 is NOBODY:
-                    values[(j + 2, start + i + 1)] = "-"
-                else:
-                    values[(j + 2, start + i + 1)] = "{} + {}".format(p2.name, p1.name)
+        # Already met table
+        if num_met != 0:
+            yield ["", ""] + names
+        else:
+            yield blank[:]
 
-        # Create already met table
-        (_, start) = values.get_bottom_right()
-        start += 3
-        size = 0
-        for p1 in self.people:
-            size = max(size, len(p1.already_met))
+        already_met = [sorted([p2.name for p2 in p1.already_met]) for p1 in self.people]
+        for met_names in itertools.zip_longest(*already_met, fillvalue=""):
+            yield ["", "Already met"] + list(met_names)
 
-        if size != 0:
-            for (i, p1) in enumerate(self.people):
-                values[(i + 2, start)] = p1.name
-            for j in range(size):
-                values[(1, start + j + 1)] = "Already met"
+        yield blank[:]
+        yield blank[:]
 
-        values[(1, start)] = ""
-        for (i, p1) in enumerate(self.people):
-            for (j, p2) in enumerate(sorted(p1.already_met, key = lambda p2: p2.name)):
-                values[(i + 2, start + j + 1)] = p2.name
-        
-        # Create normalised copy of input table
-        (_, start) = values.get_bottom_right()
-        start += 3
-        values[(1, start)] = IS_PRESENT
-        values[(0, start)] = ""
+        # Normalised copy of input table. Cells above the diagonal are
+        # "unmet", unless they are listed in changes for their row, which
+        # are applied in order (so a round number replaces "met").
         number: typing.Dict[str, int] = dict()
-
-        # Headers, presence
         for (i, p1) in enumerate(self.people):
-            values[(2 + i, start)] = p1.name
-            values[(0, 1 + i + start)] = p1.name
-            values[(1, 1 + i + start)] = str(p1.is_present).upper()
             number[p1.name] = i
 
-        # Initial state is unmet
-        for x in range(len(self.people)):
-            for y in range(len(self.people)):
-                if x > y:
-                    values[(2 + x, 1 + y + start)] = "unmet"
-                else:
-                    values[(2 + x, 1 + y + start)] = "-"
-
-        # Fill in "already met"
+        changes: typing.List[typing.List[typing.Tuple[int, str]]] = [[] for p1 in self.people]
         for p1 in self.people:
             a = number[p1.name]
-            for p2 in p1.already_met:
-                b = number[p2.name]
+            change = (a, "met")
+            for b in [number[p2.name] for p2 in p1.already_met]:
                 if a > b:
-                    values[(2 + a, 1 + b + start)] = "met"
+                    changes[b].append(change)
 
-        # Fill in round numbers if available
         for p1 in self.people:
             a = number[p1.name]
             for (i, p2) in enumerate(p1.schedule):
@@ -331,36 +408,56 @@ class Problem:
                     continue
                 b = number[p2.name]
                 if a > b:
-                    values[(2 + a, 1 + b + start)] = "{}{}".format(ROUND, i + 1)
+                    changes[b].append((a, "{}{}".format(ROUND, i + 1)))
 
+        yield ["", IS_PRESENT] + names
+        for (y, p1) in enumerate(self.people):
+            row = [p1.name, str(p1.is_present).upper()]
+            row.extend(["-"] * (y + 1))
+            row.extend(["unmet"] * (num_people - y - 1))
+            for (a, value) in changes[y]:
+                row[2 + a] = value
+            yield row
 
-        # Padding at the bottom and on the right
-        (x, y) = values.get_bottom_right()
-        values[(0, y + 1)] = ""
-        values[(0, y + 2)] = ""
-        values.pad()
+        # Padding at the bottom
+        yield blank[:]
+        yield blank[:]
 
-        return values
+    def to_spreadsheet(self) -> Spreadsheet:
+        return Spreadsheet(list(self.spreadsheet_rows()))
 
-    def to_text(self) -> str:
+    def count_rounds(self) -> int:
+        # Rounds in which someone meets someone: the final round may only
+        # have meetings with nobody, and there are none if nobody meets
+        num_rounds = 0
+        for p1 in self.people:
+            for (i, p2) in enumerate(p1.schedule):
+                if p2 is not NOBODY:
+                    num_rounds = max(num_rounds, i + 1)
+        return num_rounds
+
+    def to_text(self, bound: typing.Optional[Bound] = None) -> str:
         out: typing.List[str] = []
 
+        valid_solution = self.validate_solution()
         out.append("valid problem? {}\n".format(self.validate_problem()))
-        out.append("valid solution? {}\n".format(self.validate_solution()))
+        out.append("valid solution? {}\n".format(valid_solution))
 
-        final_round = 0
         present = 0
         for p1 in self.people:
             if p1.is_present:
                 present += 1
-                for (i, p2) in enumerate(p1.schedule):
-                    if (i > final_round) and (p2 is not NOBODY):
-                        final_round = i
 
-        num_rounds = final_round + 1
+        num_rounds = self.count_rounds()
         out.append("number of rounds {}\n".format(num_rounds))
         out.append("number of people present {}\n".format(present))
-        out.append("number of people absent {}\n\n".format(len(self.people) - present))
+        out.append("number of people absent {}\n".format(len(self.people) - present))
+
+        if bound is not None:
+            out.append("lower bound: {}\n".format(bound))
+            out.append("proven optimal? {}\n".format(
+                        valid_solution and (num_rounds <= bound.rounds)))
+        out.append("\n")
 
         for p1 in self.people:
             out.append(p1.name)
@@ -0,0 +1,136 @@
+import typing
+
+from problem import Problem, Person, NOBODY
+from colouring import EdgeColouring
+
+# Re-planning when the roster changes. Rather than solving again from
+# scratch (Solver.__init__ clears every schedule), the existing schedule is
+# kept as an edge colouring, where each round is a colour. Meetings which
+# are no longer possible (someone is now absent, or has already met) are
+# removed, and each meeting which is now missing (someone is now present)
+# is added by the cheapest of these moves:
+#
+# 1. a round in which both people are sitting out;
+# 2. a Kempe chain swap: if a is free for one person and b for the other,
+#    swapping a and b along the alternating path from the second person
+#    frees a for both, unless the path reaches the first person;
+# 3. Misra & Gries' fan rotation and path inversion, which always works
+#    when there is a spare round beyond the largest number of meetings;
+# 4. a new round at the end.
+#
+# The work done depends on the number of missing meetings and the length
+# of the paths involved, and the meetings which have to move are reported.
+
+Meeting = typing.Tuple[int, Person, Person]
+
+class Diff:
+    def __init__(self) -> None:
+        self.removed: typing.List[Meeting] = []
+        self.added: typing.List[Meeting] = []
+
+    def __len__(self) -> int:
+        return len(self.removed) + len(self.added)
+
+    def __str__(self) -> str:
+        out: typing.List[str] = []
+        for (sign, meetings) in [("-", self.removed), ("+", self.added)]:
+            for (r, p1, p2) in meetings:
+                out.append("{} round {}: {} meets {}\n".format(sign, r + 1, p1.name, p2.name))
+        return "".join(out)
+
+def meetings(people: typing.List[Person]) -> typing.Set[Meeting]:
+    result: typing.Set[Meeting] = set()
+    for p1 in people:
+        for (r, p2) in enumerate(p1.schedule):
+            if (p2 is not NOBODY) and (p1.name < p2.name):
+                result.add((r, p1, p2))
+    return result
+
+def add_meeting(colouring: EdgeColouring, u: int, v: int, max_degree: int) -> None:
+    # 1. Both free in the same round
+    free_u = [c for c in range(colouring.num_colours) if colouring.is_free(u, c)]
+    for c in free_u:
+        if colouring.is_free(v, c):
+            colouring.set_colour(u, v, c)
+            return
+
+    # 2. A Kempe chain swap
+    free_v = [c for c in range(colouring.num_colours) if colouring.is_free(v, c)]
+    for a in free_u:
+        for b in free_v:
+            if u not in colouring.path(v, b, a):
+                colouring.invert_path(v, b, a)
+                colouring.set_colour(u, v, a)
+                return
+
+    # 3. Misra & Gries
+    if max_degree < colouring.num_colours:
+        colouring.colour_edge(u, v)
+        return
+
+    # 4. A new round
+    colouring.set_colour(u, v, colouring.add_colour())
+
+def repair(problem: Problem) -> Diff:
+    # Updates the existing schedule for the current roster and already_met
+    # lists, and returns the meetings which were removed and added
+    people = [p1 for p1 in problem.people if p1.is_present]
+    index: typing.Dict[Person, int] = dict()
+    for (i, p1) in enumerate(people):
+        index[p1] = i
+
+    # Present people who have already met, by number, in both orders
+    met: typing.Set[typing.Tuple[int, int]] = set()
+    for (i, p1) in enumerate(people):
+        for p2 in p1.already_met:
+            j = index.get(p2, -1)
+            if j >= 0:
+                met.add((i, j))
+                met.add((j, i))
+
+    before = meetings(problem.people)
+    num_rounds = max([len(p1.schedule) for p1 in problem.people], default=0)
+    colouring = EdgeColouring(len(people), num_rounds)
+
+    # Keep the meetings that can still happen
+    for (r, p1, p2) in sorted(before, key=lambda m: (m[0], m[1].name)):
+        i = index.get(p1, -1)
+        j = index.get(p2, -1)
+        if ((i >= 0) and (j >= 0) and (r < len(p2.schedule)) and (p2.schedule[r] is p1)
+        and ((i, j) not in met) and (colouring.get_colour(i, j) < 0)
+        and colouring.is_free(i, r) and colouring.is_free(j, r)):
+            colouring.set_colour(i, j, r)
+
+    # Add the meetings that are missing
+    todo: typing.List[typing.Tuple[int, int]] = []
+    degree = [0 for p1 in people]
+    for i in range(len(people)):
+        for j in range(i + 1, len(people)):
+            if (i, j) not in met:
+                degree[i] += 1
+                degree[j] += 1
+                if colouring.get_colour(i, j) < 0:
+                    todo.append((i, j))
+
+    max_degree = max(degree, default=0)
+    for (i, j) in todo:
+        add_meeting(colouring, i, j, max_degree)
+
+    # Trailing rounds with no meetings are dropped
+    num_rounds = colouring.num_colours
+    while (num_rounds > 0) and all([colouring.is_free(i, num_rounds - 1)
+                                        for i in range(len(people))]):
+        num_rounds -= 1
+
+    for p1 in problem.people:
+        p1.schedule.clear()
+    for (i, p1) in enumerate(people):
+        for r in range(num_rounds):
+            j = colouring.at[i][r]
+            p1.schedule.append(NOBODY if j < 0 else people[j])
+
+    after = meetings(problem.people)
+    diff = Diff()
+    diff.removed = sorted(before - after, key=lambda m: (m[0], m[1].name))
+    diff.added = sorted(after - before, key=lambda m: (m[0], m[1].name))
+    return diff
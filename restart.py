@@ -0,0 +1,95 @@
+import typing
+import random
+import sys
+
+import prism
+import triangle
+
+# Randomised restarts for the triangle.py and prism.py heuristics.
+# Both heuristics fail because of one bad early choice, and neither can
+# recover except by exhaustive backtracking. Instead, each attempt breaks
+# ties in availability with a different seeded random number generator,
+# and when an attempt fails, a new one is started. The first attempt
+# always uses the original (y, x) tie break.
+#
+# triangle.py attempts are also cut off after a number of backtracks
+# which follows the Luby sequence (1, 1, 2, 1, 1, 2, 4, ...) times a unit,
+# so that most attempts are short but some are allowed to search for
+# longer. prism.py never backtracks, so each of its attempts runs to
+# completion or failure.
+
+Schedule = typing.List[triangle.Pairs]
+
+def luby(i: int) -> int:
+    # i-th term of the Luby sequence, counting from 1
+    assert i >= 1
+    k = 1
+    while ((1 << k) - 1) < i:
+        k += 1
+    while i != ((1 << k) - 1):
+        i -= (1 << (k - 1)) - 1
+        k = 1
+        while ((1 << k) - 1) < i:
+            k += 1
+    return 1 << (k - 1)
+
+def make_rng(seed: int, attempt: int) -> typing.Optional[random.Random]:
+    if attempt == 0:
+        return None
+    return random.Random((seed * 1000003) + attempt)
+
+def solve_triangle(num_people: int, seed: int = 0, max_attempts: int = 100,
+                    unit: int = 32) -> typing.Tuple[int, Schedule]:
+    # Returns the number of attempts made, and the best schedule found
+    # (the one with the most complete rounds)
+    best: Schedule = []
+    for attempt in range(max_attempts):
+        g = triangle.Grid(num_people, make_rng(seed, attempt))
+        g.backtrack_limit = unit * luby(attempt + 1)
+        schedule: Schedule = []
+        try:
+            for i in range(num_people - 1):
+                pairs = g.find_pairs(False, True)
+                if len(pairs) != (num_people // 2):
+                    raise triangle.CantSolveError()
+                schedule.append(pairs)
+        except (triangle.CantSolveError, triangle.BacktrackError):
+            pass
+
+        if len(schedule) > len(best):
+            best = schedule
+        if len(best) == (num_people - 1):
+            return (attempt + 1, best)
+
+    return (max_attempts, best)
+
+def solve_prism(num_people: int, seed: int = 0,
+                    max_attempts: int = 100) -> typing.Tuple[int, Schedule]:
+    # Returns the number of attempts made, and the best schedule found
+    # (the one with the most pairs placed)
+    best: Schedule = []
+    for attempt in range(max_attempts):
+        p = prism.Prism(num_people, make_rng(seed, attempt))
+        try:
+            p.fill()
+            p.check()
+            return (attempt + 1, [s.pairs for s in p.slices])
+        except prism.CantSolveError:
+            schedule = [s.pairs for s in p.slices]
+            if sum(map(len, schedule)) > sum(map(len, best)):
+                best = schedule
+
+    return (max_attempts, best)
+
+if __name__ == "__main__":
+    seed = 0
+    if len(sys.argv) > 1:
+        seed = int(sys.argv[1])
+
+    for np in range(4, 40, 2):
+        (attempts, schedule) = solve_triangle(np, seed)
+        print("triangle: number of people = {} attempts = {} rounds = {}".format(
+                np, attempts, len(schedule)), flush=True)
+        (attempts, schedule) = solve_prism(np, seed)
+        print("prism: number of people = {} attempts = {} pairs = {}".format(
+                np, attempts, sum(map(len, schedule))), flush=True)
@@ -0,0 +1,191 @@
+import typing
+import json
+import random
+import re
+import time
+
+from problem import Cell
+
+# Reading and writing Google Sheets ranges. The API is reached through a
+# Transport, which sends one batchGet or batchUpdate request per call:
+# capture.py has the transport for the real API, and FakeSheetsServer
+# keeps the sheets in memory, for tests and benchmarks.
+#
+# SheetsClient reads all the ranges it needs in one request, and only
+# writes the cells that differ from what the sheet holds already. Changed
+# cells in each row are grouped into runs, and runs with the same columns
+# in consecutive rows are sent as one range, so rewriting a whole table
+# takes a few ranges. Requests rejected because of the quota are tried
+# again after an exponential backoff.
+
+Values = typing.List[typing.List[str]]
+ValueRange = typing.Dict[str, typing.Any]
+
+# Unchanged cells between two changes in a row are sent again, rather than
+# starting a new range, if there are no more than this many
+MAX_GAP = 8
+
+DEFAULT_MAX_RETRIES = 5
+DEFAULT_BACKOFF = 1.0
+MAX_BACKOFF = 64.0
+
+T = typing.TypeVar("T")
+
+class QuotaError(Exception):
+    pass
+
+def cell_name_fn(cell: Cell) -> str:
+    (column, row) = cell
+    return "R{}C{}".format(row + 1, column + 1)
+
+def range_name(sheet: str, top_left: Cell, bottom_right: Cell) -> str:
+    return "{}!{}:{}".format(sheet, cell_name_fn(top_left), cell_name_fn(bottom_right))
+
+def diff(sheet: str, old: Values, new: Values) -> typing.List[ValueRange]:
+    # Ranges which turn old into new. Cells which are only in old are
+    # cleared, as the API leaves out trailing blank cells and rows.
+
+    # Open blocks, by (first column, last column): (first row, rows)
+    blocks: typing.Dict[typing.Tuple[int, int], typing.Tuple[int, Values]] = dict()
+    result: typing.List[ValueRange] = []
+
+    def close(x1: int, x2: int) -> None:
+        (y1, rows) = blocks.pop((x1, x2))
+        result.append({
+            "range": range_name(sheet, (x1, y1), (x2, y1 + len(rows) - 1)),
+            "values": rows,
+        })
+
+    for y in range(max(len(old), len(new))):
+        old_row = old[y] if y < len(old) else []
+        new_row = new[y] if y < len(new) else []
+        width = max(len(old_row), len(new_row))
+        old_row = old_row + ([""] * (width - len(old_row)))
+        new_row = new_row + ([""] * (width - len(new_row)))
+        changed: typing.List[int] = []
+        if old_row != new_row:
+            changed = [x for (x, (v1, v2)) in enumerate(zip(old_row, new_row)) if v1 != v2]
+
+        runs: typing.List[typing.Tuple[int, int]] = []
+        for x in changed:
+            if runs and ((x - runs[-1][1]) <= (MAX_GAP + 1)):
+                runs[-1] = (runs[-1][0], x)
+            else:
+                runs.append((x, x))
+
+        # Blocks which don't continue into this row are finished
+        for (x1, x2) in [key for key in blocks if key not in runs]:
+            close(x1, x2)
+
+        for (x1, x2) in runs:
+            row = new_row[x1:x2 + 1]
+            if (x1, x2) in blocks:
+                blocks[(x1, x2)][1].append(row)
+            else:
+                blocks[(x1, x2)] = (y, [row])
+
+    for (x1, x2) in list(blocks):
+        close(x1, x2)
+    return result
+
+class Transport(typing.Protocol):
+    # Anything with these methods can be used: it needn't subclass Transport
+    def batch_get(self, spreadsheet_id: str, ranges: typing.List[str]) -> typing.List[Values]:
+        ...
+
+    def batch_update(self, spreadsheet_id: str, data: typing.List[ValueRange]) -> None:
+        ...
+
+class SheetsClient:
+    def __init__(self, transport: Transport, spreadsheet_id: str,
+                    max_retries: int = DEFAULT_MAX_RETRIES,
+                    backoff: float = DEFAULT_BACKOFF,
+                    sleep: typing.Callable[[float], None] = time.sleep) -> None:
+        self.transport = transport
+        self.spreadsheet_id = spreadsheet_id
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.sleep = sleep
+
+    def call(self, fn: typing.Callable[[], T]) -> T:
+        attempt = 0
+        while True:
+            try:
+                return fn()
+            except QuotaError:
+                if attempt >= self.max_retries:
+                    raise
+            delay = min(MAX_BACKOFF, self.backoff * (2 ** attempt))
+            self.sleep(random.uniform(delay / 2, delay))
+            attempt += 1
+
+    def read(self, ranges: typing.List[str]) -> typing.List[Values]:
+        return self.call(lambda: self.transport.batch_get(self.spreadsheet_id, ranges))
+
+    def write(self, sheet: str, values: Values, previous: Values) -> int:
+        # Makes the sheet hold values, given that it holds previous now,
+        # and returns the number of cells sent
+        data = diff(sheet, previous, values)
+        if len(data) != 0:
+            self.call(lambda: self.transport.batch_update(self.spreadsheet_id, data))
+        return sum([len(vr["values"]) * len(vr["values"][0]) for vr in data])
+
+class FakeSheetsServer:
+    # Stands in for the Sheets API: ranges are a sheet name, or a sheet name
+    # and R1C1 cells as made by range_name. Reads leave out trailing blank
+    # cells and rows, as the API does.
+    def __init__(self, sheets: typing.Optional[typing.Dict[str, Values]] = None) -> None:
+        self.sheets: typing.Dict[str, Values] = dict()
+        for (name, values) in (sheets or dict()).items():
+            self.sheets[name] = [list(row) for row in values]
+        self.num_requests = 0
+        self.num_cells_sent = 0
+        self.num_bytes_sent = 0
+        self.quota_failures = 0     # the next requests which fail with QuotaError
+
+    def request(self) -> None:
+        self.num_requests += 1
+        if self.quota_failures > 0:
+            self.quota_failures -= 1
+            raise QuotaError("Quota exceeded")
+
+    def parse(self, name: str) -> typing.Tuple[str, typing.Optional[typing.Tuple[Cell, Cell]]]:
+        m = re.match(r"^([^!]*)!R(\d+)C(\d+):R(\d+)C(\d+)$", name)
+        if m is None:
+            return (name, None)
+        (y1, x1, y2, x2) = [int(m.group(i)) - 1 for i in range(2, 6)]
+        return (m.group(1), ((x1, y1), (x2, y2)))
+
+    def batch_get(self, spreadsheet_id: str, ranges: typing.List[str]) -> typing.List[Values]:
+        self.request()
+        result: typing.List[Values] = []
+        for name in ranges:
+            (sheet, cells) = self.parse(name)
+            values = self.sheets.get(sheet, [])
+            if cells is not None:
+                ((x1, y1), (x2, y2)) = cells
+                values = [row[x1:x2 + 1] for row in values[y1:y2 + 1]]
+            rows = [list(row) for row in values]
+            for row in rows:
+                while row and (row[-1] == ""):
+                    row.pop()
+            while rows and (len(rows[-1]) == 0):
+                rows.pop()
+            result.append(rows)
+        return result
+
+    def batch_update(self, spreadsheet_id: str, data: typing.List[ValueRange]) -> None:
+        self.request()
+        self.num_bytes_sent += len(json.dumps(data))
+        for vr in data:
+            (sheet, cells) = self.parse(vr["range"])
+            values = self.sheets.setdefault(sheet, [])
+            (x1, y1) = cells[0] if cells is not None else (0, 0)
+            for (dy, row) in enumerate(vr["values"]):
+                while len(values) <= (y1 + dy):
+                    values.append([])
+                target = values[y1 + dy]
+                while len(target) < (x1 + len(row)):
+                    target.append("")
+                target[x1:x1 + len(row)] = row
+                self.num_cells_sent += len(row)
@@ -1,40 +1,78 @@
 
 import typing
+import multiprocessing
+import os
+import random
+import time
 
 from problem import Problem, Person, NOBODY
+from bounds import lower_bound
+from matching import max_matching
+from memo import TranspositionTable
+from symmetry import twin_masks
+from dlx import perfect_matchings
+
+class DeadlineExpired(Exception):
+    pass
 
 class SolverPerson:
     def __init__(self, person: Person, initial_index: int) -> None:
         self.person = person
         self.initial_index = initial_index
-        self.already_met: typing.Set[SolverPerson] = set()
-        self.busy = False
+        # Bit i is set if this person has met the person with initial_index i
+        self.met = 0
+        # Rounds spent waiting before this solver started
+        self.waiting_time = 0
    
-def social_score(p: SolverPerson) -> typing.Tuple[int, int]:
+def social_score(p: SolverPerson, use_schedule: bool = True) -> typing.Tuple[int, int]:
     # NOBODY is allocated last
     if p.person is NOBODY:
         return (1 << 31, 0)
 
     # Allocate the person with the fewest meetings first
     # In case of a tie, allocate the person who has been waiting longest
-    waiting_time = 0
-    for other in reversed(p.person.schedule):
-        if other is NOBODY:
-            waiting_time += 1
-        else:
-            break
+    waiting_time = p.waiting_time
+    if use_schedule:
+        for other in reversed(p.person.schedule):
+            if other is NOBODY:
+                waiting_time += 1
+            else:
+                break
 
-    return (len(p.already_met), -waiting_time)
+    return (count_bits(p.met), -waiting_time)
+
+def count_bits(mask: int) -> int:
+    return bin(mask).count("1")
 
 class Solver:
-    def __init__(self, problem: Problem) -> None:
+    def __init__(self, problem: Problem, engine: typing.Optional["RoundEngine"] = None,
+                    ordering: int = 0, time_limit: typing.Optional[float] = None,
+                    reset: bool = True) -> None:
         self.problem = problem
-        self.problem.reset()
+        self.engine = engine or search_engine
+
+        # With a time limit, the search checks the clock every so often,
+        # and when time runs out, the remaining rounds are done greedily
+        self.deadline: typing.Optional[float] = None
+        if time_limit is not None:
+            self.deadline = time.monotonic() + time_limit
+        self.nodes = 0
+        self.timed_out = False
+        self.num_rounds = 0
+
+        # States (free people, next p1) from which a round can't be completed
+        self.failed = TranspositionTable()
+
+        # The schedules are cleared, unless only find_round will be used:
+        # then they are left alone, and waiting_time is all that counts
+        # as waiting
+        self.use_schedule = reset
+        if reset:
+            self.problem.reset()
 
         # Filter out people who are not present
         self.my_people: typing.List[SolverPerson] = []
         for person in self.problem.people:
-            assert len(person.schedule) == 0
             if person.is_present:
                 self.my_people.append(SolverPerson(person, len(self.my_people)))
 
@@ -45,65 +83,124 @@ class Solver:
             self.my_people.append(SolverPerson(NOBODY, len(self.my_people)))
 
         self.num_pairs = self.num_people // 2
+        self.all_people = (1 << self.num_people) - 1
 
-        # Met matrix - true if people have met
+        # Met matrix - one bitmask per person
+        lookup: typing.Dict[Person, SolverPerson] = dict()
+        for p1 in self.my_people:
+            lookup[p1.person] = p1
         for p1 in self.my_people:
             for person in p1.person.already_met:
-                for p2 in self.my_people:
-                    if p2.person is person:
-                        # p1 has met p2
-                        p1.already_met.add(p2)
-                        p2.already_met.add(p1)
+                p2 = lookup.get(person)
+                if p2 is not None:
+                    # p1 has met p2
+                    p1.met |= 1 << p2.initial_index
+                    p2.met |= 1 << p1.initial_index
 
         # How many meetings haven't happened yet?
-        self.num_meetings_todo = 0
-        for p1 in self.my_people:
-            for p2 in self.my_people:
-                if ((p2 not in p1.already_met)
-                and (p1.initial_index < p2.initial_index)):
-                    self.num_meetings_todo += 1
+        num_met = sum(count_bits(p1.met) for p1 in self.my_people) // 2
+        self.num_meetings_todo = ((self.num_people * (self.num_people - 1)) // 2) - num_met
+
+        # Ties in social_score are broken by the existing order (ordering 0)
+        # or by a random ranking of the people (other orderings)
+        self.rank: typing.Optional[typing.List[int]] = None
+        if ordering != 0:
+            self.rank = list(range(self.num_people))
+            random.Random(ordering).shuffle(self.rank)
 
     def reset(self) -> None:
         # Prepare to solve - order the people so that
         # the people with the fewest meetings are allocated first
-        self.my_people.sort(key = social_score)
+        use_schedule = self.use_schedule
+        if self.rank is None:
+            self.my_people.sort(key = lambda p: social_score(p, use_schedule))
+        else:
+            rank = self.rank
+            self.my_people.sort(key = lambda p: (social_score(p, use_schedule), rank[p.initial_index]))
 
         self.pairs: typing.List[typing.Tuple[SolverPerson, SolverPerson]] = []
         self.best_pairs: typing.List[typing.Tuple[SolverPerson, SolverPerson]] = []
+
+        # Bitmasks for this round are indexed by position in my_people:
+        # free has bit i set if my_people[i] isn't busy, and position_met[i]
+        # has bit j set if my_people[i] has met my_people[j]
+        position = [0 for p1 in self.my_people]
+        for (i, p1) in enumerate(self.my_people):
+            position[p1.initial_index] = i
+
+        self.position_met: typing.List[int] = []
         for p1 in self.my_people:
-            p1.busy = False
+            mask = 0
+            met = p1.met
+            while met:
+                bit = met & -met
+                mask |= 1 << position[bit.bit_length() - 1]
+                met ^= bit
+            self.position_met.append(mask)
+
+        # Twins have met the same people, so they are interchangeable. Only
+        # allocate_next uses them, so search_engine finds them.
+        self.twins: typing.List[int] = []
+        self.free = self.all_people
+        self.failed.clear()
+
+    def check_deadline(self) -> None:
+        # Called at each node of a search: the clock is only read every so often
+        if self.deadline is not None:
+            self.nodes += 1
+            if ((self.nodes % 1024) == 0) and (time.monotonic() > self.deadline):
+                raise DeadlineExpired()
 
     def allocate_next(self, i1: int, i2: int) -> bool:
+        if self.deadline is not None:
+            self.check_deadline()
+
         # Find first person who can be allocated
         some_p2_exists = False
-        while i1 < self.num_people:
-            p1 = self.my_people[i1]
-            if not p1.busy:
-                # p1 can be allocated
-                while i2 < self.num_people:
-                    p2 = self.my_people[i2]
-                    if (not p2.busy) and (p2 not in p1.already_met):
-                        # p2 can be allocated
-                        some_p2_exists = True
-                        self.pairs.append((p1, p2))
-                        p1.busy = True
-                        p2.busy = True
-                        
-                        if len(self.pairs) > len(self.best_pairs):
-                            self.best_pairs.clear()
-                            self.best_pairs.extend(self.pairs)
-                            if len(self.pairs) == self.num_pairs:
-                                return True
-
-                        if self.allocate_next(i1, i2):
-                            return True
-
-                        self.pairs.pop()
-                        p1.busy = False
-                        p2.busy = False
-
-                    # advance to next p2
-                    i2 += 1
+        while True:
+            later = self.free >> i1
+            if not later:
+                # No complete solution was found
+                return False
+
+            skip = (later & -later).bit_length() - 1
+            if skip:
+                # advance to next p1
+                i1 += skip
+                i2 = i1 + 1
+
+            # p1 can be allocated: the candidates for p2 are
+            # free people from i2 onwards that p1 hasn't met
+            bit1 = 1 << i1
+            candidates = self.free & ~self.position_met[i1] & (-1 << i2)
+            while candidates:
+                bit2 = candidates & -candidates
+                i2 = bit2.bit_length() - 1
+
+                # p2 can be allocated
+                some_p2_exists = True
+                self.pairs.append((self.my_people[i1], self.my_people[i2]))
+                self.free ^= bit1 | bit2
+
+                if len(self.pairs) > len(self.best_pairs):
+                    self.best_pairs.clear()
+                    self.best_pairs.extend(self.pairs)
+                    if len(self.pairs) == self.num_pairs:
+                        return True
+
+                # The same free people may be reached by pairing in a
+                # different order: if that failed, this will fail too
+                key = (self.free, i1)
+                if key not in self.failed:
+                    if self.allocate_next(i1, i2):
+                        return True
+                    self.failed.add(key)
+
+                self.pairs.pop()
+                self.free |= bit1 | bit2
+
+                # advance to next p2: twins of p2 would fail in the same way
+                candidates &= ~self.twins[i2]
 
             if some_p2_exists:
                 # No point in searching further values of p1, they
@@ -115,39 +212,244 @@ class Solver:
             i1 += 1
             i2 = i1 + 1
 
-        # No complete solution was found
-        return False
+    def add_meetings(self, pairs: typing.List[typing.Tuple[Person, Person]]) -> None:
+        # Records meetings which happened outside the solver. People who
+        # aren't present are ignored.
+        lookup: typing.Dict[Person, SolverPerson] = dict()
+        for sp in self.my_people:
+            lookup[sp.person] = sp
+        for (person, other) in pairs:
+            sp1 = lookup.get(person)
+            sp2 = lookup.get(other)
+            if (sp1 is None) or (sp2 is None) or (sp1.met & (1 << sp2.initial_index)):
+                continue
+            sp1.met |= 1 << sp2.initial_index
+            sp2.met |= 1 << sp1.initial_index
+            self.num_meetings_todo -= 1
+
+    def is_round_robin(self) -> bool:
+        # True if nobody has met anybody (Problem 1)
+        return self.num_meetings_todo == (
+                (self.num_people * (self.num_people - 1)) // 2)
+
+    def round_robin(self) -> None:
+        # Problem 1 is solved directly by the circle method. The last person
+        # stays still while everyone else rotates around a circle: in round r,
+        # the last person meets person r, and the people at r + i and r - i meet.
+        # This gives N - 1 rounds (N if odd, with NOBODY padding) without search.
+        circle = self.num_people - 1
+        for r in range(circle):
+            self.best_pairs = [(self.my_people[r], self.my_people[circle])]
+            for i in range(1, self.num_pairs):
+                self.best_pairs.append((self.my_people[(r + i) % circle],
+                                        self.my_people[(r - i) % circle]))
+            self.record_round(r + 1)
 
-    def solve(self) -> None:
+    def find_round(self) -> None:
+        # Fill best_pairs with the pairs for the next round. Searching engines
+        # call check_deadline; others (such as blossom_engine, which takes
+        # polynomial time) are stopped at the start of a round.
+        self.reset()
+        try:
+            if (self.deadline is not None) and (time.monotonic() >= self.deadline):
+                raise DeadlineExpired()
+            self.engine(self)
+        except DeadlineExpired:
+            # Out of time: use the best pairs found for this round,
+            # and complete the remaining rounds greedily
+            self.timed_out = True
+            self.engine = greedy_engine
+            if len(self.best_pairs) == 0:
+                greedy_engine(self)
+
+    def solve(self) -> bool:
+        # Returns True if the schedule is proven to have the fewest rounds
         for p1 in self.my_people:
             assert len(p1.person.schedule) == 0
 
-        num_rounds = 0
-        while self.num_meetings_todo > 0:
-            self.reset()
-            self.allocate_next(0, 1)
-            num_rounds += 1
-
-            assert len(self.best_pairs) != 0
-
-            for (p1, p2) in self.best_pairs:
-                p1.already_met.add(p2)
-                p2.already_met.add(p1)
-                self.num_meetings_todo -= 1
-                assert self.num_meetings_todo >= 0
-                if p1.person is not NOBODY:
-                    p1.person.schedule.append(p2.person)
-                if p2.person is not NOBODY:
-                    p2.person.schedule.append(p1.person)
-
-            for p1 in self.my_people:
-                if p1.person is NOBODY:
-                    continue
-                assert len(p1.person.schedule) <= num_rounds
-                assert (num_rounds - 1) <= len(p1.person.schedule)
-                if len(p1.person.schedule) == (num_rounds - 1):
-                    p1.person.schedule.append(NOBODY)
-
-
-def solve(problem: Problem) -> None:
-    Solver(problem).solve()
+        if self.is_round_robin():
+            self.round_robin()
+        else:
+            while self.num_meetings_todo > 0:
+                self.find_round()
+                self.record_round(self.num_rounds + 1)
+
+        return self.problem.count_rounds() <= lower_bound(self.problem).rounds
+
+    def record_round(self, num_rounds: int) -> None:
+        self.num_rounds = num_rounds
+        assert len(self.best_pairs) != 0
+
+        for (p1, p2) in self.best_pairs:
+            p1.met |= 1 << p2.initial_index
+            p2.met |= 1 << p1.initial_index
+            self.num_meetings_todo -= 1
+            assert self.num_meetings_todo >= 0
+            if p1.person is not NOBODY:
+                p1.person.schedule.append(p2.person)
+            if p2.person is not NOBODY:
+                p2.person.schedule.append(p1.person)
+
+        for p1 in self.my_people:
+            if p1.person is NOBODY:
+                continue
+            assert len(p1.person.schedule) <= num_rounds
+            assert (num_rounds - 1) <= len(p1.person.schedule)
+            if len(p1.person.schedule) == (num_rounds - 1):
+                p1.person.schedule.append(NOBODY)
+
+# A round engine fills solver.best_pairs with the pairs for the next round.
+# It is called after Solver.reset(), so my_people is in social_score order.
+RoundEngine = typing.Callable[[Solver], None]
+
+def search_engine(solver: Solver) -> None:
+    # Depth-first search, stopping at the first complete round
+    solver.twins = twin_masks(solver.position_met)
+    solver.allocate_next(0, 1)
+
+def blossom_engine(solver: Solver) -> None:
+    # Maximum matching on the graph of people who haven't met, in
+    # polynomial time. social_score order is kept as a tie-break.
+    neighbours: typing.List[typing.List[int]] = []
+    for (i1, met) in enumerate(solver.position_met):
+        unmet = solver.all_people & ~met & ~(1 << i1)
+        neighbours.append([i2 for i2 in range(solver.num_people) if (unmet >> i2) & 1])
+
+    for (i1, i2) in enumerate(max_matching(neighbours)):
+        if i1 < i2:
+            solver.best_pairs.append((solver.my_people[i1], solver.my_people[i2]))
+
+def greedy_engine(solver: Solver) -> None:
+    # Pair each person with the first available partner, without
+    # backtracking. Cheap, but the round may not be as large as possible.
+    free = solver.all_people
+    for i1 in range(solver.num_people):
+        bit1 = 1 << i1
+        if free & bit1:
+            candidates = free & ~solver.position_met[i1] & ~bit1
+            if candidates:
+                bit2 = candidates & -candidates
+                free ^= bit1 | bit2
+                solver.best_pairs.append((solver.my_people[i1],
+                                          solver.my_people[bit2.bit_length() - 1]))
+
+def round_matchings(solver: Solver) -> typing.Iterator[
+                    typing.List[typing.Tuple[SolverPerson, SolverPerson]]]:
+    # Every complete round which is possible now, found as exact covers
+    # with dancing links. Can be used to look ahead at alternatives.
+    pairs: typing.List[typing.Tuple[int, int]] = []
+    for (i1, met) in enumerate(solver.position_met):
+        unmet = solver.all_people & ~met & (-1 << (i1 + 1))
+        pairs.extend((i1, i2) for i2 in range(i1 + 1, solver.num_people) if (unmet >> i2) & 1)
+
+    for matching in perfect_matchings(list(range(solver.num_people)), pairs,
+                                      solver.check_deadline):
+        yield [(solver.my_people[i1], solver.my_people[i2]) for (i1, i2) in matching]
+
+def dlx_engine(solver: Solver) -> None:
+    # Take the first complete round found by dancing links. If there is
+    # no complete round, fall back on the search for the largest one.
+    for pairs in round_matchings(solver):
+        solver.best_pairs.extend(pairs)
+        return
+
+    search_engine(solver)
+
+def solve(problem: Problem, engine: RoundEngine = search_engine,
+            time_limit: typing.Optional[float] = None) -> bool:
+    # Returns True if the schedule is proven to have the fewest rounds
+    return Solver(problem, engine, time_limit=time_limit).solve()
+
+Round = typing.List[typing.Tuple[Person, Person]]
+
+def solve_online(problem: Problem, engine: RoundEngine = blossom_engine,
+            time_limit: typing.Optional[float] = None) -> typing.Generator[Round, typing.Optional[Round], None]:
+    # Yields the pairs for one round at a time, planned from the live state
+    # of the problem, without solving ahead. Send back the pairs who actually
+    # met (or None if the round went as planned): they are added to
+    # already_met. People may be marked present or absent between rounds.
+    # The time limit applies to each round. Schedules are not used or changed.
+    waiting: typing.Dict[Person, int] = dict()
+    solver: typing.Optional[Solver] = None
+    present: typing.List[Person] = []
+    while True:
+        # The solver is kept from round to round, unless someone has
+        # arrived or left
+        now_present = [person for person in problem.people if person.is_present]
+        if (solver is None) or (now_present != present):
+            solver = Solver(problem, engine, reset=False)
+            present = now_present
+
+        solver.engine = engine
+        if time_limit is not None:
+            solver.deadline = time.monotonic() + time_limit
+        for sp in solver.my_people:
+            sp.waiting_time = waiting.get(sp.person, 0)
+
+        solver.find_round()
+        pairs = [(sp1.person, sp2.person) for (sp1, sp2) in solver.best_pairs
+                    if (sp1.person is not NOBODY) and (sp2.person is not NOBODY)]
+        if len(pairs) == 0:
+            # Nobody else can meet
+            return
+
+        held = yield pairs
+        if held is None:
+            held = pairs
+
+        busy: typing.Set[Person] = set()
+        for (person, other) in held:
+            if other not in person.already_met:
+                person.already_met.append(other)
+                other.already_met.append(person)
+            busy.add(person)
+            busy.add(other)
+        solver.add_meetings(held)
+
+        for person in problem.people:
+            if person.is_present:
+                waiting[person] = 0 if person in busy else waiting.get(person, 0) + 1
+
+PortfolioTask = typing.Tuple[typing.Dict[str, typing.Any], int, RoundEngine]
+PortfolioResult = typing.Tuple[int, int, typing.Dict[str, typing.Any]]
+
+def solve_ordering(task: PortfolioTask) -> PortfolioResult:
+    # Worker process: solve with one tie-break ordering
+    (data, ordering, engine) = task
+    problem = Problem.from_dict(data)
+    Solver(problem, engine, ordering).solve()
+    num_rounds = max([len(p1.schedule) for p1 in problem.people], default=0)
+    return (num_rounds, ordering, problem.to_dict())
+
+def solve_parallel(problem: Problem, engine: RoundEngine = search_engine,
+                    num_orderings: int = 0, num_workers: int = 0) -> None:
+    # Portfolio search: the problem is solved with several tie-break orderings
+    # at once, in separate processes. The schedule with the fewest rounds wins,
+    # and if a schedule can't be beaten, the other workers are stopped.
+    num_workers = num_workers or os.cpu_count() or 1
+    num_orderings = num_orderings or num_workers
+    bound = lower_bound(problem).rounds
+    tasks = [(problem.to_dict(), ordering, engine) for ordering in range(num_orderings)]
+
+    best: typing.Optional[PortfolioResult] = None
+    pool = multiprocessing.Pool(min(num_workers, num_orderings))
+    try:
+        for result in pool.imap_unordered(solve_ordering, tasks):
+            if (best is None) or (result[:2] < best[:2]):
+                best = result
+            if best[0] <= bound:
+                break
+    finally:
+        pool.terminate()
+        pool.join()
+
+    assert best is not None
+    solution = Problem.from_dict(best[2])
+    lookup: typing.Dict[str, Person] = dict()
+    lookup[NOBODY.name] = NOBODY
+    for p1 in problem.people:
+        lookup[p1.name] = p1
+
+    problem.reset()
+    for p1 in solution.people:
+        lookup[p1.name].schedule.extend([lookup[p2.name] for p2 in p1.schedule])
@@ -0,0 +1,77 @@
+import typing
+
+# Symmetry detection for the round searches. The graph is given as one
+# bitmask of neighbours per person (who has met whom, or equivalently who
+# still has to meet whom; the symmetries are the same).
+#
+# Colour refinement splits the people into classes which no automorphism
+# can mix: people start with the same colour, and are repeatedly split by
+# the colours of their neighbours until nothing changes. People in one
+# class are not necessarily interchangeable, so each class is then checked
+# for twins: u and v are twins if they have the same neighbours apart from
+# each other. Any permutation of a set of twins is an automorphism of the
+# graph, so if a search choice involving one twin fails, the same choice
+# with another twin fails too, and the search only needs to try the first.
+
+Colours = typing.List[int]
+
+def neighbour_list(mask: int) -> typing.List[int]:
+    result: typing.List[int] = []
+    while mask:
+        bit = mask & -mask
+        result.append(bit.bit_length() - 1)
+        mask ^= bit
+    return result
+
+def refine(neighbours: typing.List[int],
+            colours: typing.Optional[Colours] = None) -> Colours:
+    # Returns the coarsest equitable refinement of the initial colours.
+    # Colour numbers are assigned in order of their signatures, not the
+    # order of the people, so that relabelling the people relabels the
+    # result in the same way.
+    num_people = len(neighbours)
+    if colours is None:
+        colours = [0 for i in range(num_people)]
+    adjacent = [neighbour_list(mask) for mask in neighbours]
+
+    num_colours = -1
+    while True:
+        signatures = [(colours[i], sorted([colours[j] for j in adjacent[i]]))
+                        for i in range(num_people)]
+        order = sorted(set([(c, tuple(s)) for (c, s) in signatures]))
+        if len(order) == num_colours:
+            return colours
+
+        number = dict([(sig, n) for (n, sig) in enumerate(order)])
+        colours = [number[(c, tuple(s))] for (c, s) in signatures]
+        num_colours = len(order)
+
+def is_twin(neighbours: typing.List[int], u: int, v: int) -> bool:
+    others = ~((1 << u) | (1 << v))
+    return (neighbours[u] & others) == (neighbours[v] & others)
+
+def twin_classes(neighbours: typing.List[int]) -> Colours:
+    # Returns a class number for each person: people with the same class
+    # number are twins. Classes are numbered from 0 by their first member.
+    colours = refine(neighbours)
+    twin_of = [-1 for i in neighbours]
+    num_classes = 0
+    for u in range(len(neighbours)):
+        if twin_of[u] >= 0:
+            continue
+        twin_of[u] = num_classes
+        for v in range(u + 1, len(neighbours)):
+            if ((twin_of[v] < 0) and (colours[u] == colours[v])
+                    and is_twin(neighbours, u, v)):
+                twin_of[v] = num_classes
+        num_classes += 1
+    return twin_of
+
+def twin_masks(neighbours: typing.List[int]) -> typing.List[int]:
+    # Returns a bitmask for each person, with a bit set for each of their
+    # twins, including themselves
+    twin_of = twin_classes(neighbours)
+    members = [0 for i in neighbours]
+    for (i, c) in enumerate(twin_of):
+        members[c] |= 1 << i
+    return [members[c] for c in twin_of]
@@ -1,10 +1,29 @@
 
 import json
+import os
 import random
+import struct
+import tempfile
 import typing
 
-from problem import Problem, Person, NOBODY, Cell
-from solve import solve
+import pytest
+
+from problem import Problem, Person, NOBODY, Cell, CaptureError, IS_PRESENT, Spreadsheet
+from solve import Solver, solve, solve_parallel, solve_online, round_matchings, blossom_engine, dlx_engine
+from dlx import perfect_matchings
+from restart import luby, solve_triangle, solve_prism
+from colouring import solve_by_colouring
+from bounds import lower_bound
+from memo import TranspositionTable
+from triangle import Grid, BacktrackError
+from prism import Prism, Slice, ChoiceHeap
+from symmetry import refine, twin_classes, twin_masks
+from cache import SolutionCache, canonical_labelling
+from repair import repair, meetings
+from core import Core, NOT_MET
+import binary
+from sheets import SheetsClient, FakeSheetsServer, QuotaError, cell_name_fn
+from watch import Watcher
 
 def test_simple() -> None:
     # The solver must come up with a solution that's
@@ -295,3 +314,985 @@ def test_ysj() -> None:
 
         # Nobody has to wait for more than two rounds
         assert max_bored <= 2, scenario
+
+def test_round_robin() -> None:
+    # When nobody has already met, the schedule is generated directly
+    # (no search) so much larger groups can be solved. N - 1 rounds are
+    # needed if N is even, N if N is odd.
+    for num_people in [30, 31, 200, 201]:
+        problem = Problem()
+        for i in range(num_people):
+            problem.people.append(Person('{:03d}'.format(i), True))
+
+        solve(problem)
+        assert problem.validate_solution()
+
+        schedule_size = num_people - 1 + (num_people % 2)
+        for person in problem.people:
+            assert len(person.schedule) == schedule_size
+            assert person.schedule.count(NOBODY) == (num_people % 2)
+
+def test_blossom_engine() -> None:
+    # Each round is a maximum matching found in polynomial time, so
+    # large dense Problem 2 inputs can be solved
+    r = random.Random(1)
+    for num_people in [8, 9, 100]:
+        problem = Problem()
+        for i in range(num_people):
+            problem.people.append(Person('{:03d}'.format(i), True))
+        for p1 in problem.people:
+            for p2 in problem.people:
+                if (p2.name > p1.name) and (r.random() >= 0.5):
+                    p1.already_met.append(p2)
+                    p2.already_met.append(p1)
+
+        solve(problem, blossom_engine)
+        assert problem.validate_solution()
+
+    for scenario in ["ysj", "ysj2"]:
+        problem = Problem.from_dict(json.load(open("test_{}.json".format(scenario), "rt")))
+        solve(problem, blossom_engine)
+        assert problem.validate_solution()
+
+def test_numpy_grid() -> None:
+    # NumpyGrid is optional, as it needs numpy. It must score and order
+    # the candidates in the same way as Grid, so the rounds are the same.
+    triangle_numpy = pytest.importorskip("triangle_numpy")
+    for num_people in [4, 6, 8, 10, 12, 14]:
+        g1 = Grid(num_people)
+        g2 = triangle_numpy.NumpyGrid(num_people)
+        for i in range(num_people - 1):
+            g1.reset_busy()
+            g2.reset_busy()
+            assert g1.find_candidates() == g2.find_candidates()
+            pairs = g1.find_pairs(False, True)
+            assert pairs == g2.find_pairs(False, True)
+            assert len(pairs) == (num_people // 2)
+        assert g1.backtracks == g2.backtracks
+
+def test_availability() -> None:
+    # Grid and Slice keep availability counts up to date, rather than
+    # counting the free cells in a row and column each time as before.
+    # Counting them instead must give the same schedules and backtracks.
+    class RecountGrid(Grid):
+        def visit_related(self, cr: int, mark_busy: bool) -> int:
+            count = len(self.partial_footprint(cr))
+            assert count == self.availability[cr]
+            Grid.visit_related(self, cr, mark_busy)
+            return count
+
+    class RecountSlice(Slice):
+        def visit_related(self, cr: int, mark_busy: bool) -> int:
+            count = len([i for i in range(self.num_people)
+                    if (i != cr) and not self.grid[(max(i, cr), min(i, cr))].busy])
+            assert count == self.availability[cr]
+            Slice.visit_related(self, cr, mark_busy)
+            return count
+
+    # The default tie break only backtracks from N = 20, which is slow
+    # to recount, but with these random tie breaks it backtracks sooner
+    for (num_people, seed) in [(8, None), (16, None), (10, 1), (12, 2), (14, 25)]:
+        g1 = Grid(num_people, None if seed is None else random.Random(seed))
+        g2 = RecountGrid(num_people, None if seed is None else random.Random(seed))
+        for i in range(num_people - 1):
+            pairs = g1.find_pairs(False, True)
+            assert pairs == g2.find_pairs(False, True)
+            if len(pairs) < (num_people // 2):
+                break
+        assert g1.backtracks == g2.backtracks
+        assert (seed is None) or (g1.backtracks > 0)
+
+    for num_people in [8, 12, 16]:
+        p1 = Prism(num_people)
+        p2 = Prism(num_people)
+        p2.slices = [RecountSlice(z, num_people) for z in range(num_people - 1)]
+        p1.fill()
+        p2.fill()
+        assert [s.pairs for s in p1.slices] == [s.pairs for s in p2.slices]
+
+    # Undo restores the counts and the cells after a backtrack
+    g = Grid(10)
+    g.set_met(5, 2)
+    g.reset_busy()
+    def state() -> typing.Tuple[typing.List[int], typing.List[typing.Tuple[bool, bool]]]:
+        return (g.availability[:], [(g.is_met(x, y), g.is_busy(x, y))
+                                    for x in range(1, 10) for y in range(x)])
+    before = state()
+    g.push()
+    g.set_met(1, 0)
+    middle = state()
+    g.push()
+    g.set_met(9, 3)
+    g.set_met(7, 4)
+    g.pop()
+    assert state() == middle
+    g.pop()
+    assert state() == before
+    assert g.availability == [len(g.partial_footprint(i)) for i in range(10)]
+
+def test_candidates() -> None:
+    # Person 0 has met everyone except 5, so (5, 0) is a forced move: it
+    # has the lowest availability and is the first candidate
+    g = Grid(6)
+    for x in range(1, 5):
+        g.set_met(x, 0)
+    g.reset_busy()
+    assert g.is_met(4, 0) and g.is_busy(4, 0)
+    assert not g.is_met(5, 0) and not g.is_busy(5, 0)
+    candidates = g.find_candidates()
+    assert candidates[0] == ((1, 5, 0, 5), 5, 0)
+    assert len(candidates) == 11
+    assert (5, 0) in g.find_pairs(False, False)
+
+    # After a pair is chosen, its rows and columns are busy but not met
+    g = Grid(6)
+    g.push()
+    g.set_met(5, 0)
+    assert g.is_met(5, 0)
+    assert not (g.is_busy(2, 1) or g.is_busy(3, 1))
+    assert g.is_busy(5, 1) and not g.is_met(5, 1)
+    assert all([(x not in (0, 5)) and (y not in (0, 5)) for (_, x, y) in g.find_candidates()])
+
+    # When everyone is busy, there are no candidates, and the round is
+    # complete
+    g.set_met(2, 1)
+    g.set_met(4, 3)
+    assert g.find_candidates() == []
+    assert g.find_all_available(False, 0) == []
+    assert g.find_some_pairs(False, 0, True) == (0, [])
+    g.pop()
+    assert not (g.is_busy(2, 1) or g.is_busy(5, 0))
+    assert len(g.find_candidates()) == 15
+
+    # Nobody can be paired with person 0, who has met everyone: the round
+    # can't be completed without backtracking, and can't be completed at all
+    g = Grid(4)
+    for x in range(1, 4):
+        g.set_met(x, 0)
+    g.reset_busy()
+    assert [(x, y) for (_, x, y) in g.find_candidates()] == [(2, 1), (3, 1), (3, 2)]
+    try:
+        g.find_pairs(False, False)
+        assert False
+    except BacktrackError:
+        pass
+    assert g.find_pairs(False, True) == []
+
+def test_choice_heap() -> None:
+    # Random additions, changes in both directions and removals, checked
+    # against the minimum of all the choices
+    r = random.Random(1)
+    heap = ChoiceHeap()
+    choices: typing.Dict[typing.Tuple[int, int, int], typing.Any] = dict()
+    for step in range(2000):
+        key = (r.randrange(6), r.randrange(6), r.randrange(3))
+        if (key in choices) and (r.random() < 0.3):
+            heap.remove(key)
+            del choices[key]
+        else:
+            (x, y, z) = key
+            choice = ((r.randrange(10), r.randrange(10), z, y, x), x, y, z)
+            heap.update(choice)
+            choices[key] = choice
+
+        assert len(heap) == len(choices)
+        for (i, choice) in enumerate(heap.heap):
+            assert heap.index[choice[1:]] == i
+            assert (i == 0) or (heap.heap[(i - 1) // 2] <= choice)
+        if len(choices) != 0:
+            assert heap.first() == min(choices.values())
+
+def test_colouring() -> None:
+    # Misra-Gries edge colouring never needs more than D + 1 rounds,
+    # where D is the most meetings that anyone still needs
+    r = random.Random(1)
+    for scenario in range(50):
+        problem = Problem()
+        num_people = r.randrange(2, 30)
+        for i in range(num_people):
+            problem.people.append(Person('{:03d}'.format(i), r.random() >= 0.1))
+        for p1 in problem.people:
+            for p2 in problem.people:
+                if (p2.name > p1.name) and (r.random() >= 0.5):
+                    p1.already_met.append(p2)
+                    p2.already_met.append(p1)
+
+        degree = 0
+        for p1 in problem.people:
+            if p1.is_present:
+                todo = [p2 for p2 in problem.people if p2.is_present
+                        and (p2 is not p1) and (p2 not in p1.already_met)]
+                degree = max(degree, len(todo))
+
+        solve_by_colouring(problem)
+        assert problem.validate_problem()
+        for p1 in problem.people:
+            if p1.is_present:
+                assert len(p1.schedule) <= (degree + 1)
+                met = [p2 for p2 in p1.schedule if p2 is not NOBODY]
+                assert len(set(met)) == len(met)
+                for p2 in problem.people:
+                    if p2.is_present and (p2 is not p1):
+                        assert (p2 in p1.already_met) or (p2 in met)
+
+    for name in ["ysj", "ysj2"]:
+        with open("test_{}.json".format(name), "rt") as fd:
+            problem = Problem.from_dict(json.load(fd))
+        solve_by_colouring(problem)
+        assert problem.validate_solution()
+
+def test_dlx() -> None:
+    # Every perfect matching is found exactly once: there are
+    # 1, 3, 15, 105 ways to pair up 2, 4, 6, 8 people (double factorial)
+    for (num_people, expect) in [(0, 1), (2, 1), (4, 3), (6, 15), (8, 105)]:
+        people = list(range(num_people))
+        pairs = [(a, b) for a in people for b in people if a < b]
+        found = set()
+        for matching in perfect_matchings(people, pairs):
+            assert sorted(sum(matching, ())) == people
+            found.add(tuple(sorted(matching)))
+        assert len(found) == expect
+
+    # Solving with the exact cover engine
+    r = random.Random(1)
+    for scenario in range(20):
+        problem = Problem()
+        for i in range(9):
+            problem.people.append(Person(str(i), True))
+        for p1 in problem.people:
+            for p2 in problem.people:
+                if (p2.name > p1.name) and (r.random() >= 0.5):
+                    p1.already_met.append(p2)
+                    p2.already_met.append(p1)
+
+        solve(problem, dlx_engine)
+        assert problem.validate_solution()
+
+def test_exact_cover() -> None:
+    # Grid.can_solve gives the same answer whether rounds are completed
+    # with dancing links or by its own search
+    r = random.Random(2)
+    for scenario in range(200):
+        num_people = r.choice([4, 6, 8, 10])
+        g = Grid(num_people)
+        for x in range(1, num_people):
+            for y in range(x):
+                if r.random() < 0.4:
+                    g.change(g.grid[(x, y)], True, True)
+        g.reset_busy()
+        for single_round in [True, False]:
+            expect = g.copy().can_solve([], single_round)
+            assert g.copy().can_solve([], single_round, exact_cover=True) == expect
+
+    # round_matchings yields every complete round exactly once
+    def count_rounds(people: typing.List[int], met: typing.Set[typing.Tuple[int, int]]) -> int:
+        if len(people) == 0:
+            return 1
+        return sum(count_rounds([p for p in people[1:] if p != p2], met)
+                    for p2 in people[1:] if (people[0], p2) not in met)
+
+    num_rounds: typing.List[int] = []
+    for scenario in range(10):
+        problem = Problem()
+        for i in range(10):
+            problem.people.append(Person(str(i), True))
+        problem.people[4].is_present = False
+        met: typing.Set[typing.Tuple[int, int]] = set()
+        for (i, p1) in enumerate(problem.people):
+            for (j, p2) in enumerate(problem.people):
+                if (i < j) and (r.random() < 0.4):
+                    p1.already_met.append(p2)
+                    p2.already_met.append(p1)
+                    met.update([(i, j), (j, i)])
+
+        solver = Solver(problem, dlx_engine)
+        solver.reset()
+        rounds: typing.Set[typing.FrozenSet[typing.FrozenSet[Person]]] = set()
+        found = list(round_matchings(solver))
+        for pairs_found in found:
+            # Everyone present is paired once, with someone they haven't met
+            people = [sp.person for pair in pairs_found for sp in pair]
+            assert sorted(people, key=id) == sorted([sp.person for sp in solver.my_people], key=id)
+            for (sp1, sp2) in pairs_found:
+                assert sp2.person not in sp1.person.already_met
+            rounds.add(frozenset(frozenset((sp1.person, sp2.person)) for (sp1, sp2) in pairs_found))
+        num_rounds.append(len(rounds))
+
+        # NOBODY (-1) makes the number of people even
+        present = [i for (i, p1) in enumerate(problem.people) if p1.is_present]
+        if (len(present) % 2) == 1:
+            present.append(-1)
+        assert len(rounds) == len(found) == count_rounds(present, met)
+    assert max(num_rounds) > 1
+
+def test_parallel() -> None:
+    # The portfolio includes the default ordering, so it can't do
+    # worse than the serial solver
+    for scenario in ["ysj", "ysj2"]:
+        problem = Problem.from_dict(json.load(open("test_{}.json".format(scenario), "rt")))
+        solve(problem)
+        serial_rounds = len(problem.people[0].schedule)
+
+        problem = Problem.from_dict(json.load(open("test_{}.json".format(scenario), "rt")))
+        solve_parallel(problem, num_orderings=4, num_workers=2)
+        assert problem.validate_solution()
+        assert len(problem.people[0].schedule) <= serial_rounds
+
+def test_restarts() -> None:
+    assert [luby(i) for i in range(1, 16)] == [1, 1, 2, 1, 1, 2, 4, 1, 1, 2, 1, 1, 2, 4, 8]
+
+    # The triangle heuristic fails at N = 20, and the prism heuristic
+    # at N = 22, unless ties are broken differently
+    for (num_people, solver) in [(20, solve_triangle), (22, solve_prism)]:
+        (attempts, schedule) = solver(num_people, 0, 10)
+        assert attempts > 1
+        assert len(schedule) == (num_people - 1)
+        met = set()
+        for pairs in schedule:
+            assert len(pairs) == (num_people // 2)
+            busy: typing.Set[int] = set()
+            for (x, y) in pairs:
+                assert (x, y) not in met
+                assert not ({x, y} & busy)
+                met.add((x, y))
+                busy.update((x, y))
+        assert len(met) == ((num_people * (num_people - 1)) // 2)
+
+def test_time_limit() -> None:
+    # Without a time limit, this search takes far too long to find the
+    # fewest rounds, but a valid schedule is still produced in time
+    r = random.Random(11)
+    problem = Problem()
+    for i in range(22):
+        problem.people.append(Person('{:03d}'.format(i), True))
+    for p1 in problem.people:
+        for p2 in problem.people:
+            if (p2.name > p1.name) and (r.random() < 0.25):
+                p1.already_met.append(p2)
+                p2.already_met.append(p1)
+
+    assert problem.validate_problem()
+    solver = Solver(problem, time_limit=0.5)
+    solver.solve()
+    assert solver.timed_out
+    assert problem.validate_solution()
+
+    # Every engine stops when time runs out: here, straight away
+    for engine in [blossom_engine, dlx_engine]:
+        problem.reset()
+        solver = Solver(problem, engine, time_limit=0.0)
+        solver.solve()
+        assert solver.timed_out
+        assert problem.validate_solution()
+
+    # A quick search is proven to be optimal
+    problem = Problem()
+    for i in range(8):
+        problem.people.append(Person(chr(ord('A') + i), True))
+    solver = Solver(problem, time_limit=10.0)
+    assert solver.solve()
+    assert not solver.timed_out
+    assert problem.validate_solution()
+
+def test_lower_bound() -> None:
+    # Everyone must meet: N - 1 rounds for even N, N rounds for odd N
+    for num_people in range(2, 10):
+        problem = Problem()
+        for i in range(num_people):
+            problem.people.append(Person(chr(ord('A') + i), True))
+        bound = lower_bound(problem)
+        assert bound.rounds == (num_people - 1 + (num_people % 2))
+        assert solve(problem)
+        assert "proven optimal? True" in problem.to_text(lower_bound(problem))
+
+    # With nobody to meet, there are no rounds
+    for num_people in range(2):
+        problem = Problem()
+        for i in range(num_people):
+            problem.people.append(Person(chr(ord('A') + i), True))
+        assert lower_bound(problem).rounds == 0
+        assert solve(problem)
+        assert problem.count_rounds() == 0
+        text = problem.to_text(lower_bound(problem))
+        assert "number of rounds 0\n" in text
+        assert "proven optimal? True" in text
+
+    # The odd chains from algorithms.md: everyone still has to meet two
+    # others, but three rounds are needed
+    problem = Problem()
+    for name in "ABCDEFGHIJKLMNOPQRST":
+        problem.people.append(Person(name, True))
+    lookup = dict([(p1.name, p1) for p1 in problem.people])
+    todo = set()
+    for chain in ["ASFMLDQETA", "BIGNKHRJOCPB"]:
+        for i in range(len(chain) - 1):
+            todo.add((chain[i], chain[i + 1]))
+            todo.add((chain[i + 1], chain[i]))
+    for p1 in problem.people:
+        for p2 in problem.people:
+            if (p1 is not p2) and ((p1.name, p2.name) not in todo):
+                p1.already_met.append(p2)
+
+    bound = lower_bound(problem)
+    assert bound.rounds == 3
+    assert "odd chain" in bound.reason
+    assert solve(problem)
+    assert len(problem.people[0].schedule) == 3
+    assert problem.validate_solution()
+
+def test_transposition_table() -> None:
+    table = TranspositionTable(2)
+    table.add(1)
+    table.add(2)
+    assert 1 in table
+    table.add(3)
+    assert len(table) == 2
+    assert 1 in table
+    assert 2 not in table
+    assert 3 in table
+    assert table.hits == 3
+    assert table.misses == 1
+
+    # At N = 20 the triangle heuristic makes a bad choice, and round 18
+    # can't be completed. The failed states let the search prove this
+    # without running into the backtrack limit.
+    g = Grid(20)
+    g.backtrack_limit = 100000
+    for i in range(17):
+        assert len(g.find_pairs(False, True)) == 10
+    assert len(g.find_pairs(False, True)) < 10
+    assert g.backtracks < g.backtrack_limit
+    assert g.failed_pairs.hits > 0
+
+    # Copies share can_solve's failed rounds, and asking again gives the
+    # same answer as a grid which has never searched
+    r = random.Random(4)
+    num_solved = 0
+    num_failed = 0
+    for scenario in range(50):
+        met = [(x, y) for x in range(1, 8) for y in range(x) if r.random() < 0.3]
+
+        def make_grid() -> Grid:
+            g = Grid(8)
+            for (x, y) in met:
+                g.change(g.grid[(x, y)], True, True)
+            g.reset_busy()
+            return g
+
+        # A failure to finish every round says nothing about one round
+        g = make_grid()
+        for single_round in [False, True]:
+            expect = make_grid().can_solve([], single_round)
+            hits = g.failed_rounds.hits
+            for i in range(3):
+                assert g.copy().can_solve([], single_round) == expect
+            if expect:
+                num_solved += 1
+            else:
+                num_failed += 1
+                assert g.failed_rounds.hits >= (hits + 2)
+    assert (num_solved > 0) and (num_failed > 0)
+
+def test_symmetry() -> None:
+    # A path A - B - C - D: colour refinement separates the ends from the
+    # middle, but no two people are twins
+    path = [0b0010, 0b0101, 0b1010, 0b0100]
+    assert refine(path) == [0, 1, 1, 0]
+    assert twin_classes(path) == [0, 1, 2, 3]
+
+    # A star: the leaves are twins
+    star = [0b1110, 0b0001, 0b0001, 0b0001]
+    assert twin_classes(star) == [0, 1, 1, 1]
+    assert twin_masks(star) == [0b0001, 0b1110, 0b1110, 0b1110]
+
+    # When 9 of 16 people have all met each other, a round can't be
+    # completed. Since those 9 are twins, only one of them needs to be
+    # tried with each partner.
+    g = Grid(16)
+    for x in range(9):
+        for y in range(x):
+            g.set_met(x, y)
+    assert len(g.find_pairs(False, True)) == 0
+    assert g.backtracks < 100
+
+def test_cache() -> None:
+    data = json.load(open("test_ysj.json", "rt"))
+    with tempfile.TemporaryDirectory() as directory:
+        cache = SolutionCache(directory, max_entries=2)
+        problem = Problem.from_dict(data)
+        assert cache.get(problem) is None
+        cache.solve(problem)
+        expect = problem.to_text()
+
+        # Same problem: the cached schedule is the same
+        problem = Problem.from_dict(data)
+        assert cache.get(problem) is not None
+        assert problem.to_text() == expect
+
+        # Renamed and reordered: still a hit, mapped to the new names
+        r = random.Random(1)
+        names = [pd["name"] for pd in data["people"]]
+        new_names = names[:]
+        r.shuffle(new_names)
+        rename = dict(zip(names, new_names))
+        renamed = {"people": [
+                {"name": rename[pd["name"]],
+                 "is_present": pd["is_present"],
+                 "already_met": [rename[name] for name in pd["already_met"]],
+                 "schedule": []} for pd in data["people"]]}
+        r.shuffle(renamed["people"])
+        problem = Problem.from_dict(renamed)
+        assert cache.get(problem) is not None
+        assert problem.validate_solution()
+        assert max([len(p1.schedule) for p1 in problem.people]) == 19
+
+        # Least recently used entries are removed
+        for num_people in [4, 6]:
+            problem = Problem()
+            for i in range(num_people):
+                problem.people.append(Person(str(i), True))
+            cache.solve(problem)
+        assert len(os.listdir(directory)) == 2
+        assert cache.get(Problem.from_dict(data)) is None
+
+        # Schedules found after running out of time are not kept
+        problem = Problem.from_dict(data)
+        entries = sorted(os.listdir(directory))
+        cache.solve(problem, time_limit=0.0)
+        assert problem.validate_solution()
+        assert sorted(os.listdir(directory)) == entries
+        assert cache.get(Problem.from_dict(data)) is None
+
+    # A cycle has a lot of symmetry which twins don't explain: it is only
+    # labelled if it is small
+    for (num_people, labelled) in [(8, True), (100, False)]:
+        cycle = [(1 << ((i + 1) % num_people)) | (1 << ((i - 1) % num_people))
+                    for i in range(num_people)]
+        assert (canonical_labelling(cycle) is not None) == labelled
+
+def test_repair() -> None:
+    problem = Problem.from_dict(json.load(open("test_ysj.json", "rt")))
+    solve(problem)
+    num_rounds = len(problem.people[0].schedule)
+
+    # Nothing changed: nothing to do
+    assert len(repair(problem)) == 0
+    assert problem.validate_solution()
+
+    # A latecomer: only their meetings are added, and the rest of the
+    # schedule is kept
+    latecomer = Person("Z1", True)
+    problem.people.append(latecomer)
+    diff = repair(problem)
+    assert problem.validate_solution()
+    assert len(diff.removed) == 0
+    assert len(diff.added) == (len(problem.people) - 1 - len(latecomer.already_met))
+    for (r, p1, p2) in diff.added:
+        assert latecomer in (p1, p2)
+    assert len(problem.people[0].schedule) <= (num_rounds + 1)
+
+    # Someone leaves: only their meetings are removed
+    leaver = problem.people[3]
+    leaver.is_present = False
+    diff = repair(problem)
+    assert len(diff.added) == 0
+    assert len(diff.removed) != 0
+    for (r, p1, p2) in diff.removed:
+        assert leaver in (p1, p2)
+    assert len(leaver.schedule) == 0
+    present = [p1 for p1 in problem.people if p1.is_present]
+    for p1 in present:
+        assert leaver not in p1.schedule
+        for p2 in present:
+            assert (p1 is p2) or ((p2 in p1.schedule) != (p2 in p1.already_met))
+
+    # A meeting happened early: it is taken out of the schedule
+    (r, p1, p2) = sorted(meetings(problem.people), key=lambda m: (m[0], m[1].name))[-1]
+    p1.already_met.append(p2)
+    p2.already_met.append(p1)
+    diff = repair(problem)
+    assert [(m[1], m[2]) for m in diff.removed] == [(p1, p2)]
+    assert len(diff.added) == 0
+
+def test_online() -> None:
+    problem = Problem()
+    for i in range(12):
+        problem.people.append(Person(chr(ord('A') + i), True))
+    late = problem.people[5]
+    late.is_present = False
+
+    # Schedules are left alone, and a stale one doesn't count as waiting
+    schedule = [problem.people[1], NOBODY]
+    problem.people[0].schedule = list(schedule)
+    problem.people[2].schedule = [problem.people[3], NOBODY]
+    solver = Solver(problem, reset=False)
+    solver.reset()
+    assert [sp.person for sp in solver.my_people[:3]] == problem.people[:3]
+    problem.people[2].schedule = []
+
+    rounds = solve_online(problem)
+    pairs = next(rounds)
+    num_rounds = 0
+    while True:
+        num_rounds += 1
+        busy: typing.Set[Person] = set()
+        for (p1, p2) in pairs:
+            assert p1.is_present and p2.is_present
+            assert p2 not in p1.already_met
+            assert not ({p1, p2} & busy)
+            busy.update((p1, p2))
+
+        # In round 2, the first pair doesn't meet, and in round 3,
+        # the latecomer arrives
+        held = None
+        if num_rounds == 2:
+            held = pairs[1:]
+            (missed1, missed2) = pairs[0]
+        if num_rounds == 3:
+            late.is_present = True
+        try:
+            pairs = rounds.send(held)
+        except StopIteration:
+            break
+
+    assert missed2 in missed1.already_met
+    for p1 in problem.people:
+        assert len(p1.already_met) == (len(problem.people) - 1)
+    assert problem.people[0].schedule == schedule
+    problem.reset()
+    assert problem.validate_problem()
+    assert num_rounds < 20
+
+def test_large_spreadsheet() -> None:
+    # More than the 24 names that used to be the limit
+    r = random.Random(1)
+    problem = Problem()
+    for i in range(200):
+        problem.people.append(Person('{:03d}'.format(i), r.random() >= 0.1))
+    for p1 in problem.people:
+        for p2 in problem.people:
+            if (p2.name > p1.name) and (r.random() >= 0.5):
+                p1.already_met.append(p2)
+                p2.already_met.append(p1)
+
+    values = problem.to_spreadsheet()
+    copy = Problem.from_spreadsheet(values, repr)
+    assert copy.to_dict() == problem.to_dict()
+    assert len(copy.people) == 200
+    assert values.get_bottom_right() == problem.spreadsheet_bottom_right()
+
+    # Errors are still reported with the cell name
+    (x, y) = values.get_bottom_right()
+    for start in range(y):
+        if values[(1, start)] == IS_PRESENT:
+            break
+    values[(2 + 150, 1 + 100 + start)] = "yes"
+    values[(2 + 100, 1 + 150 + start)] = "no"
+    try:
+        Problem.from_spreadsheet(values, repr)
+        assert False
+    except CaptureError as e:
+        assert str(e) == "Cell (102, {}) and (152, {}) should be the same".format(
+                    151 + start, 101 + start)
+
+def test_spreadsheet_rows() -> None:
+    problem = Problem()
+    for name in ["A", "B", "C"]:
+        problem.people.append(Person(name, True))
+    (a, b, c) = problem.people
+    a.already_met.append(c)
+    c.already_met.append(a)
+    a.schedule.extend([b, NOBODY])
+    b.schedule.extend([a, NOBODY])
+    c.schedule.extend([NOBODY, NOBODY])
+
+    values = problem.to_spreadsheet()
+    assert values.values == [
+        ["", "SOLUTION", "A", "B", "C"],
+        ["", "Round 1", "B + A", "A + B", "-"],
+        ["", "Round 2", "-", "-", "-"],
+        [""] * 5, [""] * 5,
+        ["", "", "A", "B", "C"],
+        ["", "Already met", "C", "", "A"],
+        [""] * 5, [""] * 5,
+        ["", IS_PRESENT, "A", "B", "C"],
+        ["A", "TRUE", "-", "round 1", "met"],
+        ["B", "TRUE", "-", "-", "unmet"],
+        ["C", "TRUE", "-", "-", "-"],
+        [""] * 5, [""] * 5,
+    ]
+    assert values.get_bottom_right() == problem.spreadsheet_bottom_right()
+    assert list(problem.spreadsheet_rows()) == values.values
+
+    # Large tables are made at their final size, with every row as wide
+    problem = Problem()
+    for i in range(1000):
+        problem.people.append(Person('{:04d}'.format(i), True))
+    values = problem.to_spreadsheet()
+    assert values.get_bottom_right() == problem.spreadsheet_bottom_right() == (1001, 1008)
+    assert len(values.values) == 1009
+    assert all(len(row) == 1002 for row in values.values)
+    assert values.values[6][1] == IS_PRESENT
+    assert values.values[1006][:4] == ["0999", "TRUE", "-", "-"]
+    assert values.values[1007] == [""] * 1002
+
+def test_violation() -> None:
+    problem = Problem()
+    for i in range(6):
+        problem.people.append(Person(chr(ord('A') + i), True))
+    assert problem.find_violation(problem_only=True) is None
+    violation = problem.find_violation(problem_only=False)
+    assert violation is not None
+    assert violation.person is problem.people[0]
+    assert str(violation) == "A: hasn't met everyone"
+
+    solve(problem)
+    assert problem.find_violation(problem_only=False) is None
+
+    # Meeting twice
+    (a, b, c) = problem.people[:3]
+    a.schedule[0] = a.schedule[1]
+    violation = problem.find_violation(problem_only=True)
+    assert violation is not None
+    assert violation.reason == "met someone twice"
+    assert (violation.person is a) and (violation.round_number == 1)
+    assert not problem.validate_problem()
+    problem.reset()
+
+    # One-sided already met
+    b.already_met.append(c)
+    violation = problem.find_violation(problem_only=True)
+    assert violation is not None
+    assert str(violation) == "B: already met is one-sided (C)"
+
+def test_core() -> None:
+    problem = Problem.from_dict(json.load(open("test_ysj.json", "rt")))
+    solve(problem)
+    core = Core.from_problem(problem)
+    assert core.num_people == len(problem.people)
+    assert core.num_rounds == len(problem.people[0].schedule)
+    for (i, p1) in enumerate(problem.people):
+        for (j, p2) in enumerate(problem.people):
+            if i != j:
+                assert core.is_met(i, j) == (p2 in p1.already_met)
+        for (r, p2) in enumerate(p1.schedule):
+            j = core.partner(r, i)
+            assert (p2 is NOBODY) if (j == NOT_MET) else (p2 is problem.people[j])
+
+    masks = core.met_masks()
+    assert masks[0] == sum([1 << problem.people.index(p2)
+                                for p2 in problem.people[0].already_met])
+
+    copy = core.to_problem()
+    assert copy.validate_solution()
+    assert copy.to_text() == problem.to_text()
+    assert not hasattr(problem.people[0], "__dict__")
+
+def test_binary() -> None:
+    problem = Problem.from_dict(json.load(open("test_ysj.json", "rt")))
+    solve(problem)
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, "solution.pairs")
+        binary.write(problem, filename)
+        assert binary.read(filename).to_text() == problem.to_text()
+
+        # Look up one person without reading everything
+        with binary.BinaryProblem(filename) as reader:
+            i = reader.find("G2")
+            assert reader.name(i) == "G2"
+            assert reader.is_present(i)
+            p1 = problem.people[i]
+            assert [reader.name(j) if j >= 0 else NOBODY.name
+                        for j in reader.schedule_of(i)] == [p2.name for p2 in p1.schedule]
+            for (j, p2) in enumerate(problem.people):
+                if j != i:
+                    assert reader.is_met(i, j) == (p2 in p1.already_met)
+            assert reader.find("nobody here") < 0
+
+        # Damaged files are rejected
+        data = open(filename, "rb").read()
+        (magic, version, n, r) = binary.HEADER.unpack_from(data, 0)
+        index = binary.align(binary.align(binary.HEADER.size) + n)
+
+        def patch(offset: int, fmt: str, *values: int) -> bytes:
+            return data[:offset] + struct.pack(fmt, *values) + data[offset + struct.calcsize(fmt):]
+
+        for damaged in [b"", data[:10], b"X" + data[1:], data[:len(data) - 2],
+                        binary.HEADER.pack(magic, version, n * 1000, r) + data[binary.HEADER.size:],
+                        binary.HEADER.pack(magic, version, n, r * 1000) + data[binary.HEADER.size:],
+                        patch(index, "<I", 1),
+                        patch(index + 4, "<II", 10, 5),
+                        patch(index + (4 * n), "<I", len(data))]:
+            with open(filename, "wb") as fd:
+                fd.write(damaged)
+            try:
+                binary.read(filename)
+                assert False
+            except binary.FormatError:
+                pass
+
+def test_sheets() -> None:
+    problem = Problem.from_dict(json.load(open("test_ysj.json", "rt")))
+    server = FakeSheetsServer({"Input": problem.to_spreadsheet().values})
+    delays: typing.List[float] = []
+    client = SheetsClient(server, "id", sleep=delays.append)
+
+    def trim(values: typing.List[typing.List[str]]) -> typing.List[typing.List[str]]:
+        rows = [[v for v in row] for row in values]
+        for row in rows:
+            while row and (row[-1] == ""):
+                row.pop()
+        while rows and (len(rows[-1]) == 0):
+            rows.pop()
+        return rows
+
+    # One request to read everything, and one to write the output
+    (input_values, output_values) = client.read(["Input", "Output"])
+    assert output_values == []
+    problem = Problem.from_spreadsheet(Spreadsheet(input_values), cell_name_fn)
+    solve(problem)
+    values = problem.to_spreadsheet().values
+    assert client.write("Output", values, output_values) == server.num_cells_sent
+    assert server.num_requests == 2
+    [output_values] = client.read(["Output"])
+    assert output_values == trim(values)
+    copy = Problem.from_spreadsheet(Spreadsheet(output_values), cell_name_fn)
+    assert copy.validate_solution()
+
+    # Nothing is sent if nothing has changed
+    assert client.write("Output", values, output_values) == 0
+    assert server.num_requests == 3
+
+    # Only changed cells are sent, and cells which are no longer used are cleared
+    changed = [list(row) for row in values[:10]]
+    changed[1][2] = "changed"
+    client.write("Output", changed, output_values)
+    [output_values] = client.read(["Output"])
+    assert output_values == trim(changed)
+    assert client.read(["Output!R2C1:R2C4"]) == [[["", "Round 1", "changed", changed[1][3]]]]
+
+    sent = server.num_cells_sent
+    client.write("Output", values, output_values)
+    [output_values] = client.read(["Output"])
+    assert output_values == trim(values)
+    assert server.num_cells_sent - sent < len(values) * len(values[0])
+
+    # Requests are tried again if the quota is exceeded
+    server.quota_failures = 2
+    client.read(["Input"])
+    assert len(delays) == 2
+    assert (client.backoff / 2) <= delays[0] <= client.backoff <= delays[1] <= (2 * client.backoff)
+    server.quota_failures = client.max_retries + 1
+    try:
+        client.read(["Input"])
+        assert False
+    except QuotaError:
+        pass
+
+def test_watch() -> None:
+    problem = Problem.from_dict(json.load(open("test_ysj.json", "rt")))
+    server = FakeSheetsServer({"Input": problem.to_spreadsheet().values})
+    inputs: typing.List[int] = []
+    updates: typing.List[Problem] = []
+    errors: typing.List[str] = []
+    with tempfile.TemporaryDirectory() as directory:
+        # on_input sees each problem before it is solved
+        watcher = Watcher(SheetsClient(server, "id", sleep=lambda t: None),
+                          SolutionCache(directory), time_limit=10.0,
+                          on_input=lambda problem: inputs.append(
+                                sum(len(p1.schedule) for p1 in problem.people)),
+                          on_update=lambda problem, optimal: updates.append(problem),
+                          log=errors.append)
+
+        # The first poll solves the problem and writes the output
+        assert watcher.poll()
+        assert server.num_requests == 2
+        [output] = SheetsClient(server, "id").read(["Output"])
+        copy = Problem.from_spreadsheet(Spreadsheet(output), cell_name_fn)
+        assert copy.validate_solution()
+
+        # Polls read the input, and nothing else happens if it hasn't changed
+        num_requests = server.num_requests
+        watcher.run(interval=0.0, max_polls=3)
+        assert server.num_requests == num_requests + 3
+        assert watcher.num_solved == len(updates) == 1
+
+        # A change to the sheet which doesn't change the problem
+        server.sheets["Input"].append(["", "", "a note"])
+        assert not watcher.poll()
+        assert watcher.num_solved == 1
+
+        # Someone who has met everyone is absent
+        changed = Problem.from_dict(json.load(open("test_ysj.json", "rt")))
+        absent = changed.people[0]
+        for p2 in changed.people[1:]:
+            if p2 not in absent.already_met:
+                absent.already_met.append(p2)
+                p2.already_met.append(absent)
+        absent.is_present = False
+        server.sheets["Input"] = changed.to_spreadsheet().values
+        num_requests = server.num_requests
+        assert watcher.poll()
+        assert watcher.num_solved == 2
+
+        # The output written last time is known, so it isn't read again
+        assert server.num_requests == num_requests + 2
+        assert inputs == [0, 0]
+        assert not updates[-1].people[0].is_present
+        [output] = SheetsClient(server, "id").read(["Output"])
+        copy = Problem.from_spreadsheet(Spreadsheet(output), cell_name_fn)
+        assert not copy.people[0].is_present
+        assert copy.people[0].schedule == []
+        assert copy.people[1].schedule != []
+
+        # Errors in the input are reported once, and don't stop the watcher
+        server.sheets["Input"] = [["", IS_PRESENT, "A", "A"], ["A", "TRUE"], ["A", "TRUE"]]
+        watcher.run(interval=0.0, max_polls=3)
+        assert len(errors) == 1
+        assert watcher.num_solved == 2
+
+        # Network errors are logged, and the watcher waits longer after
+        # each one in a row, until a poll succeeds
+        class FlakyServer:
+            def __init__(self, failures: int) -> None:
+                self.failures = failures
+                self.write_failures = 0
+                self.reads: typing.List[typing.List[str]] = []
+
+            def batch_get(self, spreadsheet_id: str,
+                            ranges: typing.List[str]) -> typing.List[typing.List[typing.List[str]]]:
+                if self.failures > 0:
+                    self.failures -= 1
+                    raise ConnectionResetError("Connection reset")
+                self.reads.append(ranges)
+                return server.batch_get(spreadsheet_id, ranges)
+
+            def batch_update(self, spreadsheet_id: str,
+                                data: typing.List[typing.Dict[str, typing.Any]]) -> None:
+                if self.write_failures > 0:
+                    self.write_failures -= 1
+                    raise ConnectionResetError("Connection reset")
+                server.batch_update(spreadsheet_id, data)
+
+        server.sheets["Input"] = changed.to_spreadsheet().values
+        delays: typing.List[float] = []
+        errors.clear()
+        flaky = FlakyServer(3)
+        watcher = Watcher(SheetsClient(flaky, "id"), SolutionCache(directory),
+                          time_limit=10.0, log=errors.append)
+        watcher.run(interval=0.0, sleep=delays.append, max_polls=5)
+        assert len(errors) == 3
+        assert "Connection reset" in errors[0]
+        assert [round(delay) for delay in delays] == [1, 2, 4, 0, 0]
+        assert watcher.num_solved == 1
+
+        # After a write fails, the output is read again with the input
+        server.sheets["Input"] = problem.to_spreadsheet().values
+        flaky.write_failures = 1
+        watcher.run(interval=0.0, sleep=delays.append, max_polls=2)
+        assert len(errors) == 4
+        assert flaky.reads[-2:] == [["Input"], ["Input", "Output"]]
+        [output] = SheetsClient(server, "id").read(["Output"])
+        copy = Problem.from_spreadsheet(Spreadsheet(output), cell_name_fn)
+        assert copy.validate_solution()
+        assert copy.people[0].is_present
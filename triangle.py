@@ -1,6 +1,11 @@
 import typing
+import random
 import sys
 
+from dlx import perfect_matchings
+from memo import TranspositionTable
+from symmetry import twin_classes
+
 #   x=0  1  2  3 y=
 #        g  g  g  0
 #           g  g  1
@@ -10,6 +15,7 @@ import sys
 Pair = typing.Tuple[int, int]
 Pairs = typing.List[Pair]
 Footprint = typing.List[int]
+Candidates = typing.List[typing.Tuple[typing.Any, int, int]]
 
 class CantSolveError(Exception):
     pass
@@ -21,52 +27,128 @@ class Cell:
     def __init__(self, x: int, y: int) -> None:
         self.x = x
         self.y = y
-        self.met_stack: typing.List[bool] = [False]
-        self.busy_stack: typing.List[bool] = [False]
+        self.met = False
+        self.busy = False
 
     def copy(self) -> "Cell":
         c = Cell(self.x, self.y)
-        c.met_stack = self.met_stack[:]
-        c.busy_stack = self.busy_stack[:]
+        c.met = self.met
+        c.busy = self.busy
         return c
 
-    def push(self) -> None:
-        self.met_stack.append(self.met_stack[-1])
-        self.busy_stack.append(self.busy_stack[-1])
-
-    def pop(self) -> None:
-        self.met_stack.pop()
-        self.busy_stack.pop()
+# Trail entry: a cell and its (met, busy) flags before it was changed
+Change = typing.Tuple[Cell, bool, bool]
 
 class Grid:
-    def __init__(self, num_people: int) -> None:
+    def __init__(self, num_people: int, rng: typing.Optional[random.Random] = None) -> None:
         self.num_people = num_people
         self.grid = dict()
         for x in range(1, num_people):
             for y in range(x):
                 self.grid[(x, y)] = Cell(x, y)
 
+        # Number of cells in each person's row and column which are not busy
+        self.availability = [num_people - 1 for i in range(num_people)]
+
+        # Undo log: every change made by set_met is recorded in the trail,
+        # and push() marks the current position, so that pop() only has to
+        # rewind the cells that were actually changed
+        self.trail: typing.List[Change] = []
+        self.marks: typing.List[int] = []
+
+        # With a random number generator, ties in availability are broken
+        # randomly (a new draw each round) rather than by (y, x)
+        self.rng = rng
+        self.tie_break: typing.Dict[Pair, float] = dict()
+        self.draw_tie_break()
+
+        # Search effort: find_some_pairs gives up after too many backtracks
+        self.backtracks = 0
+        self.backtrack_limit: typing.Optional[int] = None
+
+        # Failed states: in find_some_pairs, the people paired so far in
+        # this round; in can_solve, the meetings still to do at the start
+        # of a round
+        self.failed_pairs = TranspositionTable()
+        self.failed_rounds = TranspositionTable()
+
+        # Twin class of each person at the start of the round
+        self.twin_of = [i for i in range(num_people)]
+
+    def draw_tie_break(self) -> None:
+        if self.rng is not None:
+            for x in range(1, self.num_people):
+                for y in range(x):
+                    self.tie_break[(x, y)] = self.rng.random()
+
     def copy(self) -> "Grid":
         g = Grid(self.num_people)
+        g.rng = self.rng
+        g.tie_break = self.tie_break.copy()
+        g.backtracks = self.backtracks
+        g.backtrack_limit = self.backtrack_limit
+        g.twin_of = self.twin_of[:]
+        # Failed rounds are shared, as the key is the whole state
+        g.failed_rounds = self.failed_rounds
         for x in range(1, self.num_people):
             for y in range(x):
                 g.grid[(x, y)] = self.grid[(x, y)].copy()
+        g.availability = self.availability[:]
+        g.trail = [(g.grid[(c.x, c.y)], met, busy) for (c, met, busy) in self.trail]
+        g.marks = self.marks[:]
         return g
 
     def push(self) -> None:
-        for x in range(1, self.num_people):
-            for y in range(x):
-                self.grid[(x, y)].push()
+        self.marks.append(len(self.trail))
 
     def pop(self) -> None:
-        for x in range(1, self.num_people):
-            for y in range(x):
-                self.grid[(x, y)].pop()
+        mark = self.marks.pop()
+        while len(self.trail) > mark:
+            (cell, met, busy) = self.trail.pop()
+            if cell.busy and not busy:
+                self.availability[cell.x] += 1
+                self.availability[cell.y] += 1
+            cell.met = met
+            cell.busy = busy
+
+    def change(self, cell: Cell, met: bool, busy: bool) -> None:
+        if (cell.met == met) and (cell.busy == busy):
+            return
+        if len(self.marks) != 0:
+            self.trail.append((cell, cell.met, cell.busy))
+        if busy and not cell.busy:
+            self.availability[cell.x] -= 1
+            self.availability[cell.y] -= 1
+        cell.met = met
+        cell.busy = busy
+
+    def is_met(self, x: int, y: int) -> bool:
+        return self.grid[(x, y)].met
+
+    def is_busy(self, x: int, y: int) -> bool:
+        return self.grid[(x, y)].busy
 
     def reset_busy(self) -> None:
         for x in range(1, self.num_people):
             for y in range(x):
-                self.grid[(x, y)].busy_stack = [self.grid[(x, y)].met_stack[-1]]
+                self.grid[(x, y)].busy = self.grid[(x, y)].met
+
+        self.availability = [len(self.partial_footprint(i)) for i in range(self.num_people)]
+        self.trail.clear()
+        self.marks.clear()
+        self.failed_pairs.clear()
+        self.find_twins()
+        self.draw_tie_break()
+
+    def find_twins(self) -> None:
+        # People who have met the same people are interchangeable in this round
+        met = [0 for i in range(self.num_people)]
+        for x in range(1, self.num_people):
+            for y in range(x):
+                if self.is_met(x, y):
+                    met[x] |= 1 << y
+                    met[y] |= 1 << x
+        self.twin_of = twin_classes(met)
 
     def partial_footprint(self, cr: int) -> Footprint:
         assert 0 <= cr < self.num_people
@@ -74,12 +156,12 @@ class Grid:
 
         # Column cr, downwards (height of column cr is cr)
         for i in range(cr):
-            if not self.grid[(cr, i)].busy_stack[-1]:
+            if not self.grid[(cr, i)].busy:
                 footprint.append(i)
 
         # Row y, across
         for i in range(cr + 1, self.num_people):
-            if not self.grid[(i, cr)].busy_stack[-1]:
+            if not self.grid[(i, cr)].busy:
                 footprint.append(i)
 
         return footprint 
@@ -95,21 +177,19 @@ class Grid:
 
     def visit_related(self, cr: int, mark_busy: bool) -> int:
         assert 0 <= cr < self.num_people
-        count = 0
+        count = self.availability[cr]
+        if not mark_busy:
+            return count
 
         # Column cr, downwards (height of column cr is cr)
         for i in range(cr):
-            if not self.grid[(cr, i)].busy_stack[-1]:
-                count += 1
-            if mark_busy:
-                self.grid[(cr, i)].busy_stack[-1] = True
+            cell = self.grid[(cr, i)]
+            self.change(cell, cell.met, True)
 
         # Row y, across
         for i in range(cr + 1, self.num_people):
-            if not self.grid[(i, cr)].busy_stack[-1]:
-                count += 1
-            if mark_busy:
-                self.grid[(i, cr)].busy_stack[-1] = True
+            cell = self.grid[(i, cr)]
+            self.change(cell, cell.met, True)
 
         return count
 
@@ -126,7 +206,7 @@ class Grid:
         assert 0 <= y < x < self.num_people
         self.visit_related(x, True)
         self.visit_related(y, True)
-        self.grid[(x, y)].met_stack[-1] = True
+        self.change(self.grid[(x, y)], True, True)
 
     def __str__(self) -> str:
         out: typing.List[str] = []
@@ -142,9 +222,9 @@ class Grid:
             for x in range(1, self.num_people):
                 if y >= x:
                     out.append(blank)
-                elif self.grid[(x, y)].met_stack[-1]:
+                elif self.is_met(x, y):
                     out.append("met".center(w))
-                elif self.grid[(x, y)].busy_stack[-1]:
+                elif self.is_busy(x, y):
                     out.append("bsy".center(w))
                 else:
                     (a, b) = self.calculate_availability(x, y)
@@ -154,22 +234,27 @@ class Grid:
 
         return "".join(out)
 
-    def find_all_available(self, debug: bool, remaining: int) -> Pairs:
-        available: typing.List[typing.Tuple[typing.Any, int, int]] = []
+    def find_candidates(self) -> Candidates:
+        available: Candidates = []
         for y in range(self.num_people - 1):
             for x in range(y + 1, self.num_people):
-                if not self.grid[(x, y)].busy_stack[-1]:
-                    assert not self.grid[(x, y)].met_stack[-1]
+                if not self.grid[(x, y)].busy:
+                    assert not self.grid[(x, y)].met
                     (a, b) = self.calculate_availability(x, y)
 
                     # For original algorithm, use value = (y, x) here
                     # Availability: value = (a, b, y, x)
-                    value = (a, b, y, x)
+                    value: typing.Tuple[typing.Any, ...] = (a, b, y, x)
+                    if self.rng is not None:
+                        value = (a, b, self.tie_break[(x, y)], y, x)
                     available.append((value, x, y))
 
-        if len(available) != 0:
-            available.sort()
+        available.sort()
+        return available
 
+    def find_all_available(self, debug: bool, remaining: int) -> Pairs:
+        available = self.find_candidates()
+        if len(available) != 0:
             #(match, x, y) = available[0]
             #for i in range(len(available)):
             #    (score, x, y) = available[i]
@@ -209,7 +294,8 @@ class Grid:
 
         return pairs
 
-    def find_some_pairs(self, debug: bool, remaining: int, allow_bt: bool) -> typing.Tuple[int, Pairs]:
+    def find_some_pairs(self, debug: bool, remaining: int, allow_bt: bool,
+                        paired: int = 0) -> typing.Tuple[int, Pairs]:
         if remaining == 0:
             return (0, [])
 
@@ -217,16 +303,31 @@ class Grid:
         backtrack = 0
         indent = (self.num_people // 2) - remaining
         bad = True
+        failed_types: typing.Set[Pair] = set()
 
         for p in self.find_all_available(debug, remaining):
             (x, y) = p
 
+            # If a pair of twins of x and y failed, this pair fails too
+            pair_type = (min(self.twin_of[x], self.twin_of[y]),
+                         max(self.twin_of[x], self.twin_of[y]))
+            if pair_type in failed_types:
+                continue
+
             if debug:
                 print(" " * indent, "push", pairs_to_string([p]))
 
+            # The rest of the round only depends on who has been paired
+            now_paired = paired | (1 << x) | (1 << y)
+            if now_paired in self.failed_pairs:
+                if not allow_bt:
+                    raise BacktrackError()
+                failed_types.add(pair_type)
+                continue
+
             self.push()
             self.set_met(x, y)
-            (bt, pairs) = self.find_some_pairs(debug, remaining - 1, allow_bt)
+            (bt, pairs) = self.find_some_pairs(debug, remaining - 1, allow_bt, now_paired)
             backtrack += bt
             if len(pairs) == (remaining - 1):
                 pairs.insert(0, p)
@@ -240,8 +341,13 @@ class Grid:
 
             if not allow_bt:
                 raise BacktrackError()
+            self.failed_pairs.add(now_paired)
+            failed_types.add(pair_type)
             backtrack += 1
             bad = False
+            self.backtracks += 1
+            if (self.backtrack_limit is not None) and (self.backtracks > self.backtrack_limit):
+                raise BacktrackError()
             self.pop()
 
         if bad and debug:
@@ -250,7 +356,19 @@ class Grid:
         return (backtrack, [])
 
 
-    def can_solve(self, pairs: Pairs, single_round: bool) -> bool:
+    def exact_cover_round(self, busy: typing.List[bool],
+                already_met: typing.Set[Pair], test_pairs: Pairs) -> bool:
+        # Complete the round using dancing links rather than allocate_next
+        assert (self.num_people % 2) == 0
+        people = [i for i in range(self.num_people) if not busy[i]]
+        pairs = [(i1, i2) for i1 in people for i2 in people
+                    if (i1 < i2) and ((i1, i2) not in already_met)]
+        for matching in perfect_matchings(people, pairs):
+            test_pairs.extend([(i2, i1) for (i1, i2) in matching])
+            return True
+        return False
+
+    def can_solve(self, pairs: Pairs, single_round: bool, exact_cover: bool = False) -> bool:
         target_pairs = self.num_people // 2
         if len(pairs) >= target_pairs:
             # Not valid for multiple rounds
@@ -266,7 +384,7 @@ class Grid:
         already_met = set()
         for x in range(1, self.num_people):
             for y in range(x):
-                if self.grid[(x, y)].met_stack[-1]:
+                if self.is_met(x, y):
                     assert y < x
                     already_met.add((y, x))
 
@@ -279,7 +397,20 @@ class Grid:
 
         need_to_meet = need_to_meet - already_met
 
+        # Meetings still to do at the start of each round visited: if all
+        # rounds can't be completed from one of these, they never can
+        visited: typing.List[typing.Tuple[int, bool, bool]] = []
+
         while len(need_to_meet) != 0:
+            if len(test_pairs) == 0:
+                unmet = 0
+                for (y, x) in need_to_meet:
+                    unmet |= 1 << ((x * self.num_people) + y)
+                key = (unmet, single_round, exact_cover)
+                if key in self.failed_rounds:
+                    return False
+                visited.append(key)
+
             def allocate_next(i1: int, i2: int) -> bool:
                 # Find first person who can be allocated
                 some_i2_exists = False
@@ -317,8 +448,15 @@ class Grid:
                 # No complete solution was found
                 return False
 
-            if not allocate_next(0, 1):
+            if exact_cover:
+                found = self.exact_cover_round(busy, already_met, test_pairs)
+            else:
+                found = allocate_next(0, 1)
+
+            if not found:
                 # couldn't fill all pairs here
+                for key in visited:
+                    self.failed_rounds.add(key)
                 return False
 
             for (x, y) in test_pairs:
@@ -349,8 +487,8 @@ def pairs_to_string(pairs: Pairs) -> str:
         out.append(" ")
     return "".join(out)
 
-def test(num_people: int) -> None:
-    g = Grid(num_people)
+def test(num_people: int, grid_class: typing.Type[Grid] = Grid) -> None:
+    g = grid_class(num_people)
     met = set()
     stop = False
     for i in range(num_people - 1):
@@ -392,6 +530,7 @@ def test(num_people: int) -> None:
 
     assert len(met) == 0
 
-for np in range(4, 100, 2):
-    print("number of people = {}".format(np), flush=True)
-    test(np)
+if __name__ == "__main__":
+    for np in range(4, 100, 2):
+        print("number of people = {}".format(np), flush=True)
+        test(np)
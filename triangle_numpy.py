@@ -0,0 +1,114 @@
+import typing
+import random
+
+import numpy
+
+from memo import TranspositionTable
+from triangle import Grid, Footprint, Candidates, test
+
+# Alternative Grid for the availability heuristic, in which the met and
+# busy flags are held in N x N boolean matrices. The matrices are kept
+# symmetric, and the diagonal is always busy, so that the availability of
+# every person is a single row sum and every candidate pair can be scored
+# in one vectorised pass.
+
+class NumpyGrid(Grid):
+    def __init__(self, num_people: int, rng: typing.Optional[random.Random] = None) -> None:
+        self.num_people = num_people
+        self.met = numpy.zeros((num_people, num_people), dtype=bool)
+        self.busy = numpy.eye(num_people, dtype=bool)
+        self.stack: typing.List[typing.Tuple[typing.Any, typing.Any]] = []
+        self.rng = rng
+        self.noise = numpy.zeros((num_people, num_people))
+        self.draw_tie_break()
+        self.backtracks = 0
+        self.backtrack_limit: typing.Optional[int] = None
+        self.failed_pairs = TranspositionTable()
+        self.failed_rounds = TranspositionTable()
+        self.twin_of = [i for i in range(num_people)]
+
+    def draw_tie_break(self) -> None:
+        if self.rng is not None:
+            self.noise = numpy.array([[self.rng.random() for x in range(self.num_people)]
+                                        for y in range(self.num_people)])
+
+    def copy(self) -> "NumpyGrid":
+        g = NumpyGrid(self.num_people)
+        g.rng = self.rng
+        g.noise = self.noise.copy()
+        g.backtracks = self.backtracks
+        g.backtrack_limit = self.backtrack_limit
+        g.failed_rounds = self.failed_rounds
+        g.twin_of = self.twin_of[:]
+        g.met = self.met.copy()
+        g.busy = self.busy.copy()
+        g.stack = [(met.copy(), busy.copy()) for (met, busy) in self.stack]
+        return g
+
+    def push(self) -> None:
+        self.stack.append((self.met.copy(), self.busy.copy()))
+
+    def pop(self) -> None:
+        (self.met, self.busy) = self.stack.pop()
+
+    def is_met(self, x: int, y: int) -> bool:
+        return bool(self.met[x, y])
+
+    def is_busy(self, x: int, y: int) -> bool:
+        return bool(self.busy[x, y])
+
+    def reset_busy(self) -> None:
+        self.busy = self.met | numpy.eye(self.num_people, dtype=bool)
+        self.stack.clear()
+        self.failed_pairs.clear()
+        self.find_twins()
+        self.draw_tie_break()
+
+    def partial_footprint(self, cr: int) -> Footprint:
+        assert 0 <= cr < self.num_people
+        return [int(i) for i in numpy.flatnonzero(~self.busy[cr])]
+
+    def visit_related(self, cr: int, mark_busy: bool) -> int:
+        assert 0 <= cr < self.num_people
+        count = int(self.num_people - numpy.count_nonzero(self.busy[cr]))
+        if mark_busy:
+            self.busy[cr, :] = True
+            self.busy[:, cr] = True
+        return count
+
+    def set_met(self, x: int, y: int) -> None:
+        assert 0 <= y < x < self.num_people
+        self.visit_related(x, True)
+        self.visit_related(y, True)
+        self.met[x, y] = True
+        self.met[y, x] = True
+
+    def find_candidates(self) -> Candidates:
+        # Availability of every person at once
+        free = ~self.busy
+        availability = free.sum(axis=1)
+
+        # Every free pair with y < x (upper triangle, row y, column x)
+        (ys, xs) = numpy.nonzero(numpy.triu(free, 1))
+        a = numpy.minimum(availability[xs], availability[ys])
+        b = numpy.maximum(availability[xs], availability[ys])
+
+        # Sort by (a, b, y, x): lexsort uses the last key as the primary key
+        available: Candidates = []
+        if self.rng is None:
+            for i in numpy.lexsort((xs, ys, b, a)):
+                (x, y) = (int(xs[i]), int(ys[i]))
+                available.append(((int(a[i]), int(b[i]), y, x), x, y))
+        else:
+            # Random tie break between b and y
+            noise = self.noise[ys, xs]
+            for i in numpy.lexsort((xs, ys, noise, b, a)):
+                (x, y) = (int(xs[i]), int(ys[i]))
+                available.append(((int(a[i]), int(b[i]), float(noise[i]), y, x), x, y))
+        return available
+
+
+if __name__ == "__main__":
+    for np in range(4, 100, 2):
+        print("number of people = {}".format(np), flush=True)
+        test(np, NumpyGrid)
@@ -0,0 +1,130 @@
+import typing
+import hashlib
+import json
+import time
+
+from problem import Problem, Spreadsheet, CaptureError
+from sheets import SheetsClient, QuotaError, Values, cell_name_fn, DEFAULT_BACKOFF, MAX_BACKOFF
+from cache import SolutionCache
+
+# Keeps the Output sheet up to date with the Input sheet. Each poll reads
+# Input, in one request; the values API has no revision number, so a hash
+# of the values tells whether anything has changed. If they have, they are
+# parsed, and the problem is solved again only if it differs from the last
+# one solved (e.g. not if only formatting or a blank cell changed). Only
+# the cells which differ from the last output written are sent. The Output
+# sheet is read with the Input on the first poll, and again after a write
+# fails, as the sheet may then hold some of the changes.
+#
+# Network errors, and the quota still being exceeded after SheetsClient has
+# retried, don't stop the watcher: they are logged, and it waits longer
+# after each one in a row before polling again.
+
+# Seconds between polls, so that edits appear in the output within a couple
+# of seconds (allowing for the solver)
+POLL_INTERVAL = 1.0
+
+InputFn = typing.Callable[[Problem], None]
+UpdateFn = typing.Callable[[Problem, bool], None]
+
+def values_key(values: Values) -> str:
+    return hashlib.sha256(json.dumps(values).encode("utf-8")).hexdigest()
+
+def problem_key(problem: Problem) -> str:
+    return hashlib.sha256(json.dumps(problem.to_dict(), sort_keys=True)
+                            .encode("utf-8")).hexdigest()
+
+class Watcher:
+    def __init__(self, client: SheetsClient, cache: SolutionCache,
+                    time_limit: typing.Optional[float] = None,
+                    on_input: typing.Optional[InputFn] = None,
+                    on_update: typing.Optional[UpdateFn] = None,
+                    log: typing.Callable[[str], None] = print,
+                    transient: typing.Tuple[typing.Type[Exception], ...] = (OSError, )) -> None:
+        # on_input is given each new problem before it is solved, and
+        # on_update the solution. transient lists the errors which the
+        # next poll may not have.
+        self.client = client
+        self.cache = cache
+        self.time_limit = time_limit
+        self.on_input = on_input
+        self.on_update = on_update
+        self.log = log
+        self.transient = transient
+        self.values_key = ""
+        self.problem_key = ""
+        self.num_solved = 0
+        # What the Output sheet holds, or None if it must be read
+        self.output: typing.Optional[Values] = None
+
+    def poll(self) -> bool:
+        # Returns True if the Output sheet was updated. Problems in the
+        # input raise CaptureError, once for each version of the input.
+        if self.output is None:
+            # The output is read at the same time
+            (values, self.output) = self.client.read(["Input", "Output"])
+        else:
+            [values] = self.client.read(["Input"])
+
+        # The keys are only kept once the output is written, so that if
+        # writing fails, the next poll tries again
+        vkey = values_key(values)
+        if vkey == self.values_key:
+            return False
+
+        try:
+            problem = Problem.from_spreadsheet(Spreadsheet(values), cell_name_fn)
+            violation = problem.find_violation(problem_only=True)
+            if violation is not None:
+                raise CaptureError("Invalid input: {}".format(violation))
+        except CaptureError:
+            self.values_key = vkey
+            raise
+
+        pkey = problem_key(problem)
+        if pkey == self.problem_key:
+            self.values_key = vkey
+            return False
+
+        if self.on_input is not None:
+            self.on_input(problem)
+        optimal = self.cache.solve(problem, time_limit=self.time_limit)
+        assert problem.validate_solution()
+        self.num_solved += 1
+        output = problem.to_spreadsheet().values
+        try:
+            self.client.write("Output", output, self.output)
+        except Exception:
+            self.output = None
+            raise
+        self.output = output
+        self.values_key = vkey
+        self.problem_key = pkey
+        if self.on_update is not None:
+            self.on_update(problem, optimal)
+        return True
+
+    def run(self, interval: float = POLL_INTERVAL,
+                sleep: typing.Callable[[float], None] = time.sleep,
+                max_polls: typing.Optional[int] = None) -> None:
+        # Polls until max_polls is reached (or forever). Errors in the input,
+        # requests still refused because of the quota after retrying, and
+        # transient errors are reported and the next poll tries again.
+        polls = 0
+        failures = 0
+        while (max_polls is None) or (polls < max_polls):
+            start = time.monotonic()
+            try:
+                self.poll()
+                failures = 0
+            except CaptureError as err:
+                self.log(str(err))
+            except (QuotaError, ) + self.transient as err:
+                failures += 1
+                self.log("{} (failed {} times)".format(err, failures))
+            polls += 1
+
+            wait = interval
+            if failures != 0:
+                wait = max(interval, min(MAX_BACKOFF, DEFAULT_BACKOFF * (2 ** (failures - 1))))
+            sleep(max(0.0, wait - (time.monotonic() - start)))